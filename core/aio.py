@@ -0,0 +1,59 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from elasticsearch import AsyncElasticsearch
+from motor.motor_asyncio import AsyncIOMotorClient
+from mongoengine import DEFAULT_CONNECTION_NAME
+
+from sa_library.db import (
+    ANALYTICS_ALIAS,
+    DB_ANALYTICS_READ_PREFERENCE,
+    DB_HOST,
+    DB_NAME,
+    DB_PORT,
+    DB_READ_PREFERENCE,
+    DB_USER,
+    READ_PREFERENCES,
+    analytics_alias,
+    client_options,
+)
+
+# Async clients for the ASGI read views. Motor and aiohttp bind to the event loop they
+# are first used on, so one client (and one pool) is kept per loop; under an ASGI
+# server that is one per worker process.
+
+_READ_PREFERENCES = {
+    DEFAULT_CONNECTION_NAME: DB_READ_PREFERENCE,
+    ANALYTICS_ALIAS: DB_ANALYTICS_READ_PREFERENCE,
+}
+_mongo = weakref.WeakKeyDictionary()
+_es = weakref.WeakKeyDictionary()
+
+
+def _mongo_client(alias):
+    clients = _mongo.setdefault(asyncio.get_running_loop(), {})
+    if alias not in clients:
+        clients[alias] = AsyncIOMotorClient(
+            host=DB_HOST,
+            port=DB_PORT,
+            username=DB_USER,
+            read_preference=READ_PREFERENCES[_READ_PREFERENCES[alias]],
+            **client_options(),
+        )
+    return clients[alias]
+
+
+def collection(model, alias=DEFAULT_CONNECTION_NAME):
+    return _mongo_client(alias)[DB_NAME][model._get_collection_name()]
+
+
+def analytics_collection(model):
+    return collection(model, analytics_alias())
+
+
+def get_es():
+    loop = asyncio.get_running_loop()
+    if loop not in _es:
+        _es[loop] = AsyncElasticsearch(settings.ELASTICSEARCH_URL)
+    return _es[loop]
@@ -0,0 +1,59 @@
+import asyncio
+
+from pymongo.errors import OperationFailure
+
+from core import aio
+from core.cache import acache_get_or_set
+from core.models import Book, Review, YearTopSales
+from core.search import book_search_request, hits
+from core.services import (
+    INDEX_NOT_FOUND,
+    SEARCH_LIMIT,
+    search_pipelines,
+    top_rated_pipeline,
+    top_selling_pipeline,
+    top_selling_rows,
+)
+
+# Motor versions of the read services used by the async views. Same pipelines and
+# cache keys as core.services, so both kinds of views share cached results.
+
+
+async def _aggregate(coll, pipeline, **kwargs):
+    return await coll.aggregate(pipeline, **kwargs).to_list(None)
+
+
+async def get_top_rated_books(limit=10):
+    async def compute():
+        coll = aio.analytics_collection(Review)
+        return await _aggregate(coll, top_rated_pipeline(limit), allowDiskUse=True)
+    return await acache_get_or_set(f"top_rated_books:{limit}", compute, depends_on=("author", "book", "review"))
+
+
+async def get_top_selling_books(limit=50):
+    async def compute():
+        # the per-year top 5 table is one small document per year: fetch it alongside the ranking
+        books, year_top_sales = await asyncio.gather(
+            _aggregate(aio.analytics_collection(Book), top_selling_pipeline(limit)),
+            aio.analytics_collection(YearTopSales).find({}, {"year": 1, "books": 1}).to_list(None),
+        )
+        return top_selling_rows(books, year_top_sales)
+    return await acache_get_or_set(f"top_selling_books:{limit}", compute, depends_on=("author", "book", "sale", "stats"))
+
+
+async def search_books_by_summary(q, limit=SEARCH_LIMIT):
+    async def compute():
+        text, regex = search_pipelines(q, limit)
+        coll = aio.analytics_collection(Book)
+        if text:
+            try:
+                return await _aggregate(coll, text)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    raise
+        return await _aggregate(coll, regex)
+    return await acache_get_or_set(f"search_books:{q}:{limit}", compute, depends_on=("author", "book"))
+
+
+async def search_books_es(q, sort="name", order="asc"):
+    return hits(await aio.get_es().search(**book_search_request(q, sort, order)))
@@ -0,0 +1,259 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from core import index_queue, stats
+from core.cache import bump_versions
+from core.models import Book, Review, Sale
+
+logger = logging.getLogger(__name__)
+
+BULK_MAX_ITEMS = 100_000
+# items validated and written per bulk_write
+BULK_CHUNK_ITEMS = 5000
+ES_ENABLED = getattr(settings, "ES_ENABLED", False)
+SALES_BUFFER_ENABLED = getattr(settings, "SALES_BUFFER_ENABLED", False)
+SALES_BUFFER_MAX_ITEMS = getattr(settings, "SALES_BUFFER_MAX_ITEMS", 1000)
+SALES_BUFFER_INTERVAL = getattr(settings, "SALES_BUFFER_INTERVAL", 1.0)
+
+
+def parse_items(request):
+    # JSON array body, read whole: limited by DATA_UPLOAD_MAX_MEMORY_SIZE.
+    # Raises ValueError when the body can't be read as a list of objects.
+    try:
+        items = json.loads(request.body)
+    except RequestDataTooBig:
+        raise ValueError("Body too large for a JSON array; send large batches as NDJSON")
+    if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+        raise ValueError("Body must be a JSON array of objects or NDJSON")
+    if len(items) > BULK_MAX_ITEMS:
+        raise ValueError(f"At most {BULK_MAX_ITEMS} items per request")
+    return items
+
+
+def _ndjson_items(request):
+    # one item per non-blank line, read from the request stream; a line that isn't
+    # valid JSON becomes None and is reported as an invalid item
+    for line in request:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def write_items(request, write):
+    # Calls write(items, start) -> (written, errors) on BULK_CHUNK_ITEMS chunks of the body
+    # and returns the totals. NDJSON (Content-Type application/x-ndjson) is streamed from the
+    # request, so it isn't held in memory or limited by DATA_UPLOAD_MAX_MEMORY_SIZE; items past
+    # BULK_MAX_ITEMS are not read and reported as one error. Raises ValueError for a JSON
+    # array body that parse_items rejects.
+    if request.content_type == "application/x-ndjson":
+        items = _ndjson_items(request)
+    else:
+        items = parse_items(request)
+    written, errors = 0, []
+    chunk, start = [], 0
+    for i, item in enumerate(items):
+        if i >= BULK_MAX_ITEMS:
+            errors.append({"index": i, "error": f"At most {BULK_MAX_ITEMS} items per request; the rest was not read"})
+            break
+        chunk.append(item)
+        if len(chunk) >= BULK_CHUNK_ITEMS:
+            n, chunk_errors = write(chunk, start)
+            written += n
+            errors += chunk_errors
+            chunk, start = [], i + 1
+    if chunk:
+        n, chunk_errors = write(chunk, start)
+        written += n
+        errors += chunk_errors
+    return written, errors
+
+
+def _book_authors(items):
+    # one $in query for every book referenced in the batch -> {book_id: author_id}
+    ids = set()
+    for item in items:
+        try:
+            ids.add(ObjectId(item.get("book")))
+        except (InvalidId, TypeError, AttributeError):
+            pass
+    cursor = Book._get_collection().find({"_id": {"$in": list(ids)}}, {"author": 1})
+    return {doc["_id"]: doc.get("author") for doc in cursor}
+
+
+def _book_id(item, books):
+    if not isinstance(item, dict):
+        raise ValueError("Item must be a JSON object")
+    try:
+        book_id = ObjectId(item.get("book"))
+    except (InvalidId, TypeError):
+        raise ValueError("Invalid book id")
+    if book_id not in books:
+        raise ValueError("Book not found")
+    return book_id
+
+
+def _int(item, field, default=None, minimum=None, maximum=None):
+    value = item.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{field} must be an integer")
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise ValueError(f"{field} out of range")
+    return value
+
+
+def bulk_create_reviews(items, start=0):
+    # unordered inserts; returns (inserted, errors) with errors as [{"index", "error"}],
+    # indexes counted from start
+    books = _book_authors(items)
+    errors = []
+    docs, positions = [], []
+    for i, item in enumerate(items, start):
+        try:
+            docs.append({
+                "book": _book_id(item, books),
+                "score": _int(item, "score", minimum=0, maximum=5),
+                "up_votes": _int(item, "up_votes", default=0),
+            })
+            positions.append(i)
+        except ValueError as e:
+            errors.append({"index": i, "error": str(e)})
+
+    failed = set()
+    if docs:
+        try:
+            Review._get_collection().bulk_write([InsertOne(d) for d in docs], ordered=False)
+        except BulkWriteError as e:
+            for err in e.details["writeErrors"]:
+                failed.add(err["index"])
+                errors.append({"index": positions[err["index"]], "error": err["errmsg"]})
+
+    written = [d for n, d in enumerate(docs) if n not in failed]
+    if written:
+        stats.reviews_added((d["book"], books[d["book"]], d["score"]) for d in written)
+        bump_versions("review")
+        if ES_ENABLED:
+            # raw inserts don't fire the model signals
+            index_queue.enqueue_many(("review", d["_id"], index_queue.INDEX) for d in written)
+    errors.sort(key=lambda e: e["index"])
+    return len(written), errors
+
+
+def bulk_add_sales(items, start=0):
+    # $inc upserts on the (book, year) unique key; repeated keys in the batch are merged first.
+    # Returns (rows written, errors) with errors as [{"index", "error"}], indexes counted from start.
+    books = _book_authors(items)
+    errors = []
+    merged = defaultdict(int)
+    positions = defaultdict(list)
+    for i, item in enumerate(items, start):
+        try:
+            key = (_book_id(item, books), _int(item, "year"))
+            count = _int(item, "count", minimum=0)
+            # validated before touching the defaultdicts, so rejected items leave no key behind
+            merged[key] += count
+            positions[key].append(i)
+        except ValueError as e:
+            errors.append({"index": i, "error": str(e)})
+
+    keys = list(merged)
+    failed = set()
+    if keys:
+        ops = [
+            UpdateOne({"book": book_id, "year": year}, {"$inc": {"count": merged[(book_id, year)]}}, upsert=True)
+            for book_id, year in keys
+        ]
+        try:
+            Sale._get_collection().bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details["writeErrors"]:
+                failed.add(err["index"])
+                errors.extend({"index": i, "error": err["errmsg"]} for i in positions[keys[err["index"]]])
+
+    written = [k for n, k in enumerate(keys) if n not in failed]
+    if written:
+        stats.sales_added((book_id, books[book_id], year, merged[(book_id, year)]) for book_id, year in written)
+        bump_versions("sale")
+        if ES_ENABLED:
+            _enqueue_sales(written)
+    errors.sort(key=lambda e: e["index"])
+    return sum(len(positions[k]) for k in written), errors
+
+
+def _enqueue_sales(keys):
+    # upserted rows don't fire the model signals; look their ids up by (book, year)
+    query = {"$or": [{"book": book_id, "year": year} for book_id, year in keys]}
+    sales = Sale._get_collection().find(query, {"_id": 1})
+    index_queue.enqueue_many(("sale", s["_id"], index_queue.INDEX) for s in sales)
+
+
+def add_sales(book, year, count):
+    # atomic read-free increment of the (book, year) row; returns the row after the update
+    sale = Sale._get_collection().find_one_and_update(
+        {"book": book.id, "year": int(year)},
+        {"$inc": {"count": int(count)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    stats.sales_changed(book, year, count)
+    bump_versions("sale")
+    if ES_ENABLED:
+        index_queue.enqueue("sale", sale["_id"])
+    return sale
+
+
+class SalesBuffer:
+    # Merges many small (book, year) increments in memory and writes them with one
+    # bulk_add_sales call every `interval` seconds or `max_items` keys. Increments
+    # still in the buffer are lost if the process is killed.
+    def __init__(self, max_items, interval):
+        self.max_items = max_items
+        self.interval = interval
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, book_id, year, count):
+        with self._lock:
+            self._pending[(str(book_id), int(year))] += int(count)
+            full = len(self._pending) >= self.max_items
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sales-buffer", daemon=True)
+                self._thread.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        if not pending:
+            return
+        items = [{"book": book, "year": year, "count": count} for (book, year), count in pending.items()]
+        _, errors = bulk_add_sales(items)
+        for error in errors:
+            logger.error("Dropped buffered sale %s: %s", items[error["index"]], error["error"])
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered sales failed")
+
+
+sales_buffer = SalesBuffer(SALES_BUFFER_MAX_ITEMS, SALES_BUFFER_INTERVAL)
+atexit.register(sales_buffer.flush)
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.conf import settings
+
+from sa_library.db import primary_reads
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = getattr(settings, "CACHE_ENABLED", False)
+# entries are fresh for CACHE_TTL, then served stale for up to CACHE_STALE_TTL while one worker refreshes them
+CACHE_TTL = getattr(settings, "CACHE_TTL", 6 * 60 * 60)
+CACHE_STALE_TTL = getattr(settings, "CACHE_STALE_TTL", 60 * 60)
+# per-process L1 in front of the shared cache; its TTL bounds how stale another worker can be.
+# It holds the uncompressed serialized entries, so its size is their length and every hit
+# returns a fresh copy.
+CACHE_L1_TTL = getattr(settings, "CACHE_L1_TTL", 5)
+CACHE_L1_MAX_BYTES = getattr(settings, "CACHE_L1_MAX_BYTES", 64 * 1024 * 1024)
+# payloads above this size are zlib compressed before going to the shared cache
+CACHE_COMPRESS_MIN_BYTES = getattr(settings, "CACHE_COMPRESS_MIN_BYTES", 16 * 1024)
+LOCK_TIMEOUT = 60
+LOCK_WAIT = 5.0
+
+_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+# Entities a cached result can depend on; each one has a version token in the cache
+# that is bumped on every write (see core.signals), which retires all keys built on it.
+# "stats" covers the denormalized counters and YearTopSales maintained by core.stats.
+ENTITIES = ("author", "book", "review", "sale", "stats")
+
+_stats = {"l1_hits": 0, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0}
+
+
+class LocalLRU:
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, size, value = item
+            if time.time() >= expires_at:
+                del self._items[key]
+                self.size -= size
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._items[key] = (time.time() + self.ttl, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted, _) = self._items.popitem(last=False)
+                self.size -= evicted
+
+    def __len__(self):
+        return len(self._items)
+
+
+_l1 = LocalLRU(CACHE_L1_MAX_BYTES, CACHE_L1_TTL)
+_l1_versions = LocalLRU(1024 * 1024, CACHE_L1_TTL)
+
+
+def cache_stats():
+    return {**_stats, "l1_entries": len(_l1), "l1_bytes": _l1.size}
+
+
+def _version_key(entity):
+    return f"cache_version:{entity}"
+
+
+def _new_version():
+    # time based, so a token lost to eviction never comes back with an old value
+    return int(time.time() * 1000)
+
+
+def get_versions(entities):
+    versions = {e: _l1_versions.get(e) for e in entities}
+    missing = [e for e, v in versions.items() if v is None]
+    if missing:
+        found = cache.get_many([_version_key(e) for e in missing])
+        for e in missing:
+            k = _version_key(e)
+            if k not in found:
+                cache.add(k, _new_version(), timeout=None)
+                found[k] = cache.get(k)
+            versions[e] = found[k]
+            _l1_versions.set(e, found[k], 1)
+    return [versions[e] for e in entities]
+
+
+def bump_versions(*entities):
+    if not CACHE_ENABLED:
+        return
+    for entity in entities:
+        try:
+            version = cache.incr(_version_key(entity))
+        except ValueError:
+            version = _new_version()
+            cache.set(_version_key(entity), version, timeout=None)
+        # this worker sees its own writes immediately; others within CACHE_L1_TTL
+        _l1_versions.set(entity, version, 1)
+
+
+def _lock_key(key):
+    return f"lock:{key}"
+
+
+# Cached values are plain rows (dicts, lists, str, numbers); services never cache Documents.
+def _pack(raw):
+    if len(raw) >= CACHE_COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(raw, 1)
+    return b"j" + raw
+
+
+def _unpack(payload):
+    if payload[:1] == b"z":
+        return zlib.decompress(payload[1:])
+    return payload[1:]
+
+
+def _get_local(key):
+    raw = _l1.get(key)
+    return None if raw is None else orjson.loads(raw)
+
+
+def _store(key, value, timeout):
+    raw = orjson.dumps((time.time() + timeout, value))
+    cache.set(key, _pack(raw), timeout=timeout + CACHE_STALE_TTL)
+    _l1.set(key, raw, len(raw))
+
+
+def _recompute(key, func, timeout):
+    # caller holds the lock for key
+    try:
+        value = func()
+        _store(key, value, timeout)
+        return value
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def _compute_new(key, func, timeout):
+    # first value of a key version, usually right after a write bumped it: read from the primary
+    with primary_reads():
+        return _recompute(key, func, timeout)
+
+
+def _refresh_in_background(key, func, timeout):
+    try:
+        _recompute(key, func, timeout)
+    except Exception:
+        logger.exception("Background refresh of %s failed", key)
+
+
+def _get_shared(key):
+    payload = cache.get(key)
+    if payload is None:
+        _stats["l2_misses"] += 1
+        return None
+    _stats["l2_hits"] += 1
+    raw = _unpack(payload)
+    _l1.set(key, raw, len(raw))
+    return orjson.loads(raw)
+
+
+def cache_get_or_set(key, func, timeout=None, depends_on=ENTITIES):
+    if not CACHE_ENABLED:
+        return func()
+
+    timeout = timeout or CACHE_TTL
+    versions = get_versions(depends_on)
+    key = f"{key}:v{'.'.join(str(v) for v in versions)}"
+
+    entry = _get_local(key)
+    if entry is not None and time.time() < entry[0]:
+        _stats["l1_hits"] += 1
+        return entry[1]
+    _stats["l1_misses"] += 1
+
+    entry = _get_shared(key)
+    if entry is not None:
+        fresh_until, value = entry
+        if time.time() >= fresh_until and cache.add(_lock_key(key), 1, timeout=LOCK_TIMEOUT):
+            _refresher.submit(_refresh_in_background, key, func, timeout)
+        return value
+
+    if cache.add(_lock_key(key), 1, timeout=LOCK_TIMEOUT):
+        return _compute_new(key, func, timeout)
+
+    # another worker is computing this key: wait for its result instead of piling on
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = _get_shared(key)
+        if entry is not None:
+            return entry[1]
+    return func()
+
+
+async def acache_get_or_set(key, func, timeout=None, depends_on=ENTITIES):
+    # cache_get_or_set for async views: func is a coroutine function. Shared cache calls
+    # run in threads; a stale entry is refreshed in a task on the running loop.
+    if not CACHE_ENABLED:
+        return await func()
+
+    timeout = timeout or CACHE_TTL
+    versions = await sync_to_async(get_versions, thread_sensitive=False)(depends_on)
+    key = f"{key}:v{'.'.join(str(v) for v in versions)}"
+
+    entry = _get_local(key)
+    if entry is not None and time.time() < entry[0]:
+        _stats["l1_hits"] += 1
+        return entry[1]
+    _stats["l1_misses"] += 1
+
+    entry = await sync_to_async(_get_shared, thread_sensitive=False)(key)
+    add_lock = sync_to_async(cache.add, thread_sensitive=False)
+    if entry is not None:
+        fresh_until, value = entry
+        if time.time() >= fresh_until and await add_lock(_lock_key(key), 1, timeout=LOCK_TIMEOUT):
+            task = asyncio.create_task(_arecompute(key, func, timeout))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_done)
+        return value
+
+    if await add_lock(_lock_key(key), 1, timeout=LOCK_TIMEOUT):
+        with primary_reads():
+            return await _arecompute(key, func, timeout)
+
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        await asyncio.sleep(0.05)
+        entry = await sync_to_async(_get_shared, thread_sensitive=False)(key)
+        if entry is not None:
+            return entry[1]
+    return await func()
+
+
+_background_tasks = set()
+
+
+def _background_done(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error("Background refresh failed", exc_info=task.exception())
+
+
+async def _arecompute(key, func, timeout):
+    # caller holds the lock for key
+    try:
+        value = await func()
+        await sync_to_async(_store, thread_sensitive=False)(key, value, timeout)
+        return value
+    finally:
+        await sync_to_async(cache.delete, thread_sensitive=False)(_lock_key(key))
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from core.models import Book, Review, Sale
+from sa_library.db import DB_MAX_POOL_SIZE
+
+# Per-book statistics for the book detail / reviews / sales pages. Each collection is
+# read with a single $facet (totals and the page rows in one scan of the book's rows),
+# and the book, review and sale queries run concurrently: the book on the request
+# thread, the others on a shared pool sized like the Mongo connection pool.
+
+DASHBOARD_THREADS = getattr(settings, "DASHBOARD_THREADS", DB_MAX_POOL_SIZE)
+_pool = ThreadPoolExecutor(max_workers=DASHBOARD_THREADS, thread_name_prefix="book-dashboard")
+
+
+def _facet(coll, book_id, facets):
+    return next(coll.aggregate([{"$match": {"book": book_id}}, {"$facet": facets}]))
+
+
+def _page(order, skip, limit, fields):
+    stages = [{"$sort": {**order, "_id": 1}}]
+    if skip:
+        stages.append({"$skip": int(skip)})
+    if limit is not None:
+        stages.append({"$limit": int(limit)})
+    stages.append({"$project": {"_id": 0, "id": {"$toString": "$_id"}, **{f: 1 for f in fields}}})
+    return stages
+
+
+def review_stats(book_id, skip=0, limit=0):
+    # count, avg_score and `limit` reviews from `skip` (best first)
+    facets = {"summary": [{"$group": {"_id": None, "count": {"$sum": 1}, "avg_score": {"$avg": "$score"}}}]}
+    if limit:
+        facets["page"] = _page({"score": -1, "up_votes": -1}, skip, limit, ("score", "up_votes"))
+    doc = _facet(Review._get_collection(), book_id, facets)
+    summary = doc["summary"][0] if doc["summary"] else {}
+    return {
+        "count": summary.get("count", 0),
+        "avg_score": round(summary.get("avg_score") or 0, 2),
+        "page": doc.get("page", []),
+    }
+
+
+def sale_stats(book_id, skip=0, limit=None):
+    # total, years and `limit` yearly rows from `skip` (latest first); limit None for every year
+    facets = {
+        "summary": [{"$group": {"_id": None, "total": {"$sum": "$count"}, "years": {"$sum": 1}}}],
+        "page": _page({"year": -1}, skip, limit, ("year", "count")),
+    }
+    doc = _facet(Sale._get_collection(), book_id, facets)
+    summary = doc["summary"][0] if doc["summary"] else {}
+    return {
+        "total": summary.get("total", 0),
+        "years": summary.get("years", 0),
+        "page": doc["page"],
+    }
+
+
+def _load_book(book_id):
+    book = Book.objects.get(id=book_id)
+    book.author  # dereference here, not in the template
+    return book
+
+
+def get_book_dashboard(book_id, reviews=None, sales=None):
+    # reviews / sales: (skip, limit) page window, or None to leave that collection out.
+    # Returns {"book", "reviews", "sales"}; raises Book.DoesNotExist like Book.objects.get.
+    oid = Book.id.to_mongo(book_id)
+    futures = {}
+    if reviews is not None:
+        futures["reviews"] = _pool.submit(review_stats, oid, *reviews)
+    if sales is not None:
+        futures["sales"] = _pool.submit(sale_stats, oid, *sales)
+    result = {"book": _load_book(oid)}
+    result.update((name, future.result()) for name, future in futures.items())
+    return result
@@ -0,0 +1,113 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from bson import ObjectId
+from faker import Faker
+
+from core.stats import AUTHOR_STATS_ZERO, BOOK_STATS_ZERO
+
+# Synthetic library data as raw Mongo documents, generated in chunks over a process pool.
+# Every book is seeded from (seed, book index), so the dataset only depends on the seed and
+# the counts: chunk size and worker count don't change it (the Faker version can).
+
+
+def _day(d):
+    # DateField values are stored as midnight datetimes
+    return datetime(d.year, d.month, d.day)
+
+
+def _oid(rng):
+    return ObjectId(rng.randbytes(12))
+
+
+def generate_authors(count, seed):
+    faker = Faker()
+    faker.seed_instance(seed)
+    rng = random.Random(seed)
+    authors = []
+    names = set()
+    for i in range(count):
+        name = faker.name()
+        if name in names:
+            # Author.name is unique; large datasets run out of distinct fake names
+            name = f"{name} {i}"
+        names.add(name)
+        authors.append({
+            "_id": _oid(rng),
+            "name": name,
+            "birthday": _day(faker.date_of_birth(minimum_age=30, maximum_age=75)),
+            "origin_country": faker.country(),
+            "description": faker.sentence(),
+            **AUTHOR_STATS_ZERO,
+        })
+    return authors
+
+
+_author_ids = []
+
+
+def _init_worker(author_ids):
+    # sent once per worker process instead of with every chunk
+    global _author_ids
+    _author_ids = author_ids
+
+
+def generate_book_chunk(args):
+    # books start..start+count with their reviews (1..reviews_per_book each) and yearly sales
+    seed, start, count, reviews_per_book, years, last_year = args
+    faker = Faker()
+    first_pub = date(last_year - 30, 1, 1)
+    last_pub = date(last_year, 12, 31)
+
+    books, reviews, sales = [], [], []
+    for index in range(start, start + count):
+        book_seed = f"{seed}:{index}"
+        faker.seed_instance(book_seed)
+        rng = random.Random(book_seed)
+        book_id = _oid(rng)
+        books.append({
+            "_id": book_id,
+            "author": rng.choice(_author_ids),
+            "name": " ".join(faker.words(3)),
+            "summary": faker.paragraph(),
+            "publication_date": _day(faker.date_between(start_date=first_pub, end_date=last_pub)),
+            **BOOK_STATS_ZERO,
+        })
+        for _ in range(rng.randint(1, reviews_per_book)):
+            reviews.append({
+                "_id": _oid(rng),
+                "book": book_id,
+                "score": rng.randint(1, 5),
+                "up_votes": rng.randint(0, 5000),
+            })
+        for y in range(years):
+            sales.append({
+                "_id": _oid(rng),
+                "book": book_id,
+                "year": last_year - y,
+                "count": rng.randint(1000, 100000),
+            })
+    return books, reviews, sales
+
+
+def iter_book_chunks(author_ids, books, reviews_per_book, years, seed,
+                     last_year=None, chunk_size=5000, workers=None):
+    # yields (books, reviews, sales) per chunk, in chunk order, keeping at most
+    # 2 chunks per worker in flight so memory stays bounded
+    last_year = last_year or date.today().year
+    workers = workers or os.cpu_count() or 1
+    tasks = (
+        (seed, start, min(chunk_size, books - start), reviews_per_book, years, last_year)
+        for start in range(0, books, chunk_size)
+    )
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(author_ids,)) as pool:
+        window = 2 * workers
+        pending = []
+        for task in tasks:
+            pending.append(pool.submit(generate_book_chunk, task))
+            if len(pending) >= window:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
@@ -0,0 +1,125 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Durable local queue of pending Elasticsearch updates. Writes enqueue (entity, id, op)
+# rows in a SQLite file (shared by every worker process on the host); the es_index_worker
+# command drains it in batches. Rows leave the queue only after ES accepted the batch, and
+# are kept in es_history for ES_QUEUE_HISTORY_SECONDS so a reindex can replay what it missed.
+
+ES_QUEUE_PATH = getattr(settings, "ES_QUEUE_PATH", "es_queue.sqlite3")
+ES_QUEUE_HISTORY_SECONDS = getattr(settings, "ES_QUEUE_HISTORY_SECONDS", 24 * 60 * 60)
+INDEX = "index"
+DELETE = "delete"
+
+_local = threading.local()
+
+
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(ES_QUEUE_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS es_queue ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " entity TEXT NOT NULL,"
+            " doc_id TEXT NOT NULL,"
+            " op TEXT NOT NULL,"
+            " enqueued_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS es_history ("
+            " seq INTEGER PRIMARY KEY,"
+            " entity TEXT NOT NULL,"
+            " doc_id TEXT NOT NULL,"
+            " op TEXT NOT NULL,"
+            " enqueued_at REAL NOT NULL,"
+            " acked_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS es_history_acked_at ON es_history (acked_at)")
+        _local.conn = conn
+    return conn
+
+
+def enqueue(entity, doc_id, op=INDEX):
+    enqueue_many([(entity, doc_id, op)])
+
+
+def enqueue_many(rows):
+    # rows: (entity, doc_id, op); failures are logged, never raised into the request
+    now = time.time()
+    rows = [(entity, str(doc_id), op, now) for entity, doc_id, op in rows]
+    conn = _conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("INSERT INTO es_queue (entity, doc_id, op, enqueued_at) VALUES (?, ?, ?, ?)", rows)
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        logger.exception("Could not enqueue %d ES updates", len(rows))
+
+
+def fetch(limit):
+    # oldest pending rows as (seq, entity, doc_id, op, enqueued_at)
+    return _conn().execute(
+        "SELECT seq, entity, doc_id, op, enqueued_at FROM es_queue ORDER BY seq LIMIT ?", (limit,)
+    ).fetchall()
+
+
+def ack(last_seq):
+    # moves the applied rows to es_history and drops the history past its retention
+    now = time.time()
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO es_history (seq, entity, doc_id, op, enqueued_at, acked_at)"
+            " SELECT seq, entity, doc_id, op, enqueued_at, ? FROM es_queue WHERE seq <= ?",
+            (now, last_seq),
+        )
+        conn.execute("DELETE FROM es_queue WHERE seq <= ?", (last_seq,))
+        conn.execute("DELETE FROM es_history WHERE acked_at < ?", (now - ES_QUEUE_HISTORY_SECONDS,))
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def last_seq():
+    # seq of the newest row ever enqueued, 0 if none
+    row = _conn().execute("SELECT seq FROM sqlite_sequence WHERE name = 'es_queue'").fetchone()
+    return row[0] if row else 0
+
+
+def since(seq):
+    # every row enqueued after seq, applied (still in es_history) or pending, in seq order.
+    # Rows already dropped from the history are missing: compare their count with
+    # last_seq() - seq to notice it.
+    return _conn().execute(
+        "SELECT seq, entity, doc_id, op, enqueued_at FROM es_history WHERE seq > ?"
+        " UNION ALL SELECT seq, entity, doc_id, op, enqueued_at FROM es_queue WHERE seq > ?"
+        " ORDER BY seq",
+        (seq, seq),
+    ).fetchall()
+
+
+def pending():
+    # (number of rows, enqueue time of the oldest one or None)
+    return _conn().execute("SELECT COUNT(*), MIN(enqueued_at) FROM es_queue").fetchone()
+
+
+def coalesce(rows):
+    # last op per (entity, id), in order of that last op
+    latest = {}
+    for _, entity, doc_id, op, _ in rows:
+        latest.pop((entity, doc_id), None)
+        latest[(entity, doc_id)] = op
+    return latest
@@ -0,0 +1,122 @@
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import OperationFailure
+
+from core.models import AUTHORS_TABLE_COLLATION, Author, Book, Review, Sale, YearTopSales
+from core.services import (
+    SEARCH_LIMIT,
+    authors_table_pipeline,
+    search_pipelines,
+    top_rated_pipeline,
+    top_selling_pipeline,
+)
+
+MODELS = (Author, Book, Review, Sale, YearTopSales)
+
+
+def _sample_book_id():
+    doc = Book._get_collection().find_one({}, {"_id": 1})
+    return doc["_id"] if doc else ObjectId()
+
+
+def service_queries():
+    # (label, model, find filter or aggregate pipeline, sort, collation) for the query shapes the pages run
+    book_id = _sample_book_id()
+    return [
+        ("authors table: default", Author,
+         authors_table_pipeline({}, None, None, 0, 20), None, AUTHORS_TABLE_COLLATION),
+        ("authors table: name filter", Author,
+         authors_table_pipeline({"name": "a"}, "sales", "desc", 0, 20), None, AUTHORS_TABLE_COLLATION),
+        ("authors table: country filter", Author,
+         authors_table_pipeline({"country": "a"}, "country", "asc", 0, 20), None, AUTHORS_TABLE_COLLATION),
+        ("books table: default", Book, {}, {"name": 1, "_id": 1}, None),
+        ("books table: by date", Book, {}, {"publication_date": -1, "_id": -1}, None),
+        ("top rated books", Review, top_rated_pipeline(10), None, None),
+        ("top selling books", Book, top_selling_pipeline(50), None, None),
+        ("search books", Book, search_pipelines("magic dragon", SEARCH_LIMIT)[0], None, None),
+        ("book reviews page", Review, {"book": book_id}, {"score": -1, "up_votes": -1}, None),
+        ("book sales page", Sale, {"book": book_id}, {"year": -1}, None),
+        ("year top sales refresh", Sale, {"year": 2020}, {"count": -1, "book": 1}, None),
+    ]
+
+
+def explain(model, query, sort=None, collation=None):
+    coll = model._get_collection()
+    if isinstance(query, list):
+        command = {"aggregate": coll.name, "pipeline": query, "cursor": {}}
+        if collation:
+            command["collation"] = collation
+        return coll.database.command("explain", command, verbosity="queryPlanner")
+    cursor = coll.find(query, collation=collation)
+    if sort:
+        cursor = cursor.sort(list(sort.items()))
+    return cursor.explain()
+
+
+def plan_stages(node):
+    # every "stage" name under the winning plan(s) of an explain document
+    stages = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "stage" and isinstance(value, str):
+                stages.append(value)
+            elif key != "rejectedPlans":
+                stages += plan_stages(value)
+    elif isinstance(node, list):
+        for value in node:
+            stages += plan_stages(value)
+    return stages
+
+
+def missing_indexes(model):
+    # declared index keys that don't exist on the collection yet
+    existing = [list(info["key"]) for info in model._get_collection().index_information().values()]
+    missing = []
+    for spec in model._meta.get("index_specs", []):
+        fields = list(spec["fields"])
+        if any(direction == "text" for _, direction in fields):
+            # text indexes are stored under the _fts/_ftsx keys
+            fields = [("_fts", "text"), ("_ftsx", 1)]
+        if fields not in existing:
+            missing.append(fields)
+    return missing
+
+
+class Command(BaseCommand):
+    help = "Create (or with --check only verify) the declared indexes and explain the service queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="don't create anything, fail on missing indexes")
+        parser.add_argument("--explain", action="store_true", help="print the winning plan of each service query")
+        parser.add_argument("--strict", action="store_true", help="fail when a service query does a COLLSCAN")
+
+    def handle(self, *args, **options):
+        problems = []
+        for model in MODELS:
+            name = model._get_collection_name()
+            if not options["check"]:
+                model.ensure_indexes()
+            missing = missing_indexes(model)
+            for fields in missing:
+                problems.append(f"{name}: missing index {fields}")
+                self.stdout.write(self.style.ERROR(f"❌ {name}: missing index {fields}"))
+            if not missing:
+                self.stdout.write(f"✅ {name}: {len(model._meta.get('index_specs', []))} declared indexes present")
+
+        if options["explain"] or options["strict"]:
+            for label, model, query, sort, collation in service_queries():
+                try:
+                    stages = plan_stages(explain(model, query, sort, collation))
+                except OperationFailure as e:
+                    problems.append(f"{label}: {e}")
+                    self.stdout.write(self.style.ERROR(f"❌ {label}: {e}"))
+                    continue
+                line = f"{label}: {' <- '.join(stages) or 'no plan'}"
+                if "COLLSCAN" in stages:
+                    problems.append(f"{label}: COLLSCAN")
+                    self.stdout.write(self.style.WARNING(f"⚠️  {line}"))
+                else:
+                    self.stdout.write(f"   {line}")
+
+        if problems and (options["check"] or options["strict"]):
+            raise CommandError("; ".join(problems))
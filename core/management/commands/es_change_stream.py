@@ -0,0 +1,144 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import ApiError, TransportError
+from mongoengine.connection import get_db
+from pymongo.errors import OperationFailure
+
+from core import index_queue
+from core.cache import bump_versions
+from core.models import Book
+from core.search import INDEXES, sync_bulk
+
+STATE_COLLECTION = "es_sync_state"
+CHANGE_STREAM_HISTORY_LOST = 286
+MAX_BACKOFF = 30
+
+
+class Command(BaseCommand):
+    help = (
+        "Tail the Mongo change stream of author, book, review and sale and apply it to "
+        "Elasticsearch and the cache versions in batches. Needs a replica set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--name", default="es", help="consumer name; its resume token is stored under this id")
+        parser.add_argument("--batch-size", type=int, default=500, help="flush after this many distinct documents")
+        parser.add_argument("--max-wait", type=float, default=1.0, help="flush pending changes after this many seconds")
+        parser.add_argument("--from-now", action="store_true", help="ignore the stored resume token")
+        parser.add_argument("--metrics-file", default=None, help="append a CSV line of lag metrics after every batch")
+
+    def handle(self, *args, **options):
+        db = get_db()
+        state = db[STATE_COLLECTION]
+        saved = None if options["from_now"] else state.find_one({"_id": options["name"]})
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(INDEXES)},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }}]
+        watch_options = {"max_await_time_ms": int(options["max_wait"] * 1000)}
+        if saved:
+            watch_options["resume_after"] = saved["token"]
+            self.stdout.write(f"⚡ Resuming change stream '{options['name']}'...")
+        else:
+            self.stdout.write(f"⚡ Starting change stream '{options['name']}' from now...")
+
+        self.state = state
+        self.options = options
+        self.events = saved.get("events", 0) if saved else 0
+        try:
+            with db.watch(pipeline, **watch_options) as stream:
+                self.consume(stream)
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAM_HISTORY_LOST:
+                raise CommandError(
+                    "The stored resume token is no longer in the oplog: run a full reindex, then restart with --from-now"
+                )
+            raise
+
+    def consume(self, stream):
+        latest = {}
+        first_at = None
+        cluster_time = None
+        while stream.alive:
+            change = stream.try_next()
+            if change is not None:
+                key = (change["ns"]["coll"], str(change["documentKey"]["_id"]))
+                latest.pop(key, None)
+                latest[key] = index_queue.DELETE if change["operationType"] == "delete" else index_queue.INDEX
+                if self.renames_author(change):
+                    # book documents carry their author's name
+                    for book_id in Book._get_collection().distinct("_id", {"author": change["documentKey"]["_id"]}):
+                        latest.pop(("book", str(book_id)), None)
+                        latest[("book", str(book_id))] = index_queue.INDEX
+                cluster_time = change["clusterTime"].time
+                first_at = first_at or time.time()
+                self.events += 1
+
+            if latest and (
+                len(latest) >= self.options["batch_size"]
+                or time.time() - first_at >= self.options["max_wait"]
+            ):
+                self.flush(latest, stream.resume_token, cluster_time)
+                latest = {}
+                first_at = None
+            elif not latest and change is None:
+                # idle: move the stored token forward so a restart doesn't replay filtered-out history
+                self.save_token(stream.resume_token)
+
+    def renames_author(self, change):
+        if change["ns"]["coll"] != "author":
+            return False
+        if change["operationType"] == "replace":
+            return True
+        return change["operationType"] == "update" and "name" in change["updateDescription"]["updatedFields"]
+
+    def flush(self, latest, token, cluster_time):
+        started = time.time()
+        backoff = 1
+        while True:
+            try:
+                ok, failed = sync_bulk(latest)
+                break
+            except (TransportError, ApiError) as e:
+                self.stderr.write(f"❌ Elasticsearch unavailable ({e}), retrying in {backoff}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+        for error in failed:
+            self.stderr.write(f"❌ {error}")
+        bump_versions(*{entity for entity, _ in latest})
+
+        lag = time.time() - cluster_time
+        metrics = {
+            "events": self.events,
+            "docs": len(latest),
+            "ok": ok,
+            "failed": len(failed),
+            "lag_seconds": round(lag, 3),
+            "batch_seconds": round(time.time() - started, 3),
+        }
+        self.save_token(token, metrics)
+        self.stdout.write(
+            f"   {len(latest)} docs, {ok} ok, {len(failed)} failed, lag {lag:.1f}s, {self.events} events total"
+        )
+        if self.options["metrics_file"]:
+            self.write_metrics(metrics)
+
+    def save_token(self, token, metrics=None):
+        if token is None:
+            return
+        update = {"token": token, "updated_at": time.time()}
+        if metrics:
+            update.update(metrics)
+        self.state.update_one({"_id": self.options["name"]}, {"$set": update}, upsert=True)
+
+    def write_metrics(self, metrics):
+        path = self.options["metrics_file"]
+        new_file = not os.path.isfile(path)
+        with open(path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["timestamp", *metrics])
+            writer.writerow([time.strftime("%Y-%m-%d %H:%M:%S"), *metrics.values()])
@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from elasticsearch import ApiError, TransportError
+
+from core import index_queue
+from core.search import sync_bulk
+
+ES_QUEUE_BATCH_SIZE = getattr(settings, "ES_QUEUE_BATCH_SIZE", 500)
+ES_QUEUE_POLL_INTERVAL = getattr(settings, "ES_QUEUE_POLL_INTERVAL", 0.5)
+MAX_BACKOFF = 30
+
+
+class Command(BaseCommand):
+    help = "Apply the queued Elasticsearch updates (see core.index_queue) in coalesced bulk batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=ES_QUEUE_BATCH_SIZE)
+        parser.add_argument("--interval", type=float, default=ES_QUEUE_POLL_INTERVAL, help="seconds between polls of an empty queue")
+        parser.add_argument("--once", action="store_true", help="drain the queue and exit")
+
+    def handle(self, *args, **options):
+        self.stdout.write("⚡ Draining the Elasticsearch queue...")
+        backoff = 1
+        while True:
+            rows = index_queue.fetch(options["batch_size"])
+            if not rows:
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+                continue
+
+            latest = index_queue.coalesce(rows)
+            try:
+                ok, failed = sync_bulk(latest)
+            except (TransportError, ApiError) as e:
+                # ES unreachable or rejecting whole requests: keep the rows and retry
+                self.stderr.write(f"❌ Elasticsearch unavailable ({e}), retrying in {backoff}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+            backoff = 1
+
+            # these would fail again, so log them and move on
+            for error in failed:
+                self.stderr.write(f"❌ {error}")
+            index_queue.ack(rows[-1][0])
+            lag = time.time() - rows[0][4]
+            self.stdout.write(f"   {len(rows)} queued -> {len(latest)} docs, {ok} ok, {len(failed)} failed, lag {lag:.1f}s")
+
+        self.stdout.write(self.style.SUCCESS("✅ Queue drained!"))
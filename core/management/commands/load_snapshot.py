@@ -0,0 +1,49 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from dotenv import load_dotenv
+import os
+
+from core import snapshot, stats
+from core.cache import ENTITIES, bump_versions
+from core.search import INDEXES, ReindexError, reindex
+
+load_dotenv()
+ES_ENABLED = os.getenv("ES_ENABLED", "false").lower() == "true"
+
+
+class Command(BaseCommand):
+    help = "Replace the database contents with a snapshot written by make_snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="snapshot directory")
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument(
+            "--create-missing",
+            action="store_true",
+            help="generate the snapshot first (with make_snapshot defaults) when it does not exist",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not snapshot.exists(path):
+            if not options["create_missing"]:
+                raise CommandError(f"No snapshot in {path}")
+            call_command("make_snapshot", path, stdout=self.stdout)
+
+        self.stdout.write(f"⚡ Loading snapshot {path}...")
+        snapshot.load_snapshot(path, batch_size=options["batch_size"], log=self.stdout.write)
+
+        self.stdout.write("⚡ Building statistics...")
+        stats.rebuild_all()
+        bump_versions(*ENTITIES)
+        self.stdout.write(self.style.SUCCESS("✅ Snapshot loaded!"))
+
+        if not ES_ENABLED:
+            return
+        for alias in INDEXES.values():
+            self.stdout.write(f"⚡ Indexing {alias} in Elasticsearch...")
+            try:
+                reindex(alias)
+            except ReindexError as e:
+                raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS("✅ Indexing complete!"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from core.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Generate a reproducible dataset into a snapshot directory (gzipped BSON per collection)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="snapshot directory")
+        parser.add_argument("--authors", type=int, default=50)
+        parser.add_argument("--books", type=int, default=300)
+        parser.add_argument("--reviews-per-book", type=int, default=10, help="each book gets 1..N reviews")
+        parser.add_argument("--years", type=int, default=5, help="years of sales per book, up to --last-year")
+        parser.add_argument("--last-year", type=int, default=None, help="most recent sales year (default: this year)")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--workers", type=int, default=None, help="generator processes (default: CPU count)")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"⚡ Writing snapshot to {options['path']} (seed {options['seed']})...")
+        manifest = write_snapshot(
+            options["path"],
+            options["authors"],
+            options["books"],
+            options["reviews_per_book"],
+            options["years"],
+            options["seed"],
+            last_year=options["last_year"],
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ Snapshot written: {manifest['counts']}"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import stats
+from core.cache import ENTITIES, bump_versions
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized author/book statistics from reviews and sales."
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write("⚡ Rebuilding Book statistics...")
+        stats.rebuild_book_stats()
+        self.stdout.write("⚡ Rebuilding Author statistics...")
+        stats.rebuild_author_stats()
+        stats.refresh_year_top_sales()
+        bump_versions(*ENTITIES)
+        self.stdout.write(self.style.SUCCESS("✅ Statistics rebuilt!"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import INDEXES, ReindexError, reindex
+
+
+class Command(BaseCommand):
+    help = "Rebuild Elasticsearch indexes from Mongo into new versioned indexes and swap their aliases."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--index",
+            action="append",
+            choices=list(INDEXES.values()),
+            help="alias to rebuild (repeatable, default: all)",
+        )
+        parser.add_argument("--keep", type=int, default=1, help="previous versions to keep for rollback")
+
+    def handle(self, *args, **options):
+        errors = []
+        for alias in options["index"] or INDEXES.values():
+            self.stdout.write(f"⚡ Reindexing {alias}...")
+            try:
+                new = reindex(alias, keep=options["keep"])
+            except ReindexError as e:
+                errors.append(str(e))
+                self.stderr.write(f"❌ {e}")
+                continue
+            self.stdout.write(self.style.SUCCESS(f"✅ {alias} -> {new}"))
+        if errors:
+            raise CommandError("; ".join(errors))
@@ -1,80 +1,84 @@
 import random
 from datetime import date
-from django.core.management.base import BaseCommand
-from faker import Faker
+from django.core.management.base import BaseCommand, CommandError
 from mongoengine.connection import get_db
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
 import os
 
 from core.models import Author, Book, Review, Sale
-from core.search import (
-    bulk_index_authors,
-    bulk_index_books,
-    bulk_index_reviews,
-    bulk_index_sales,
-)
+from core import stats
+from core.cache import ENTITIES, bump_versions
+from core.datagen import generate_authors, iter_book_chunks
+from core.search import INDEXES, ReindexError, reindex
 
-faker = Faker()
 load_dotenv()
 ES_ENABLED = os.getenv("ES_ENABLED", "false").lower() == "true"
 
 
+def insert_books(books, reviews, sales):
+    # unordered insert; books rejected by the (author, name) index take their reviews and sales with them
+    try:
+        Book._get_collection().insert_many(books, ordered=False)
+    except BulkWriteError as e:
+        rejected = {books[err["index"]]["_id"] for err in e.details["writeErrors"]}
+        reviews = [r for r in reviews if r["book"] not in rejected]
+        sales = [s for s in sales if s["book"] not in rejected]
+    if reviews:
+        Review._get_collection().insert_many(reviews, ordered=False)
+    if sales:
+        Sale._get_collection().insert_many(sales, ordered=False)
+
+
 class Command(BaseCommand):
     help = "Seed MongoDB with authors, books, reviews, and sales."
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument("--authors", type=int, default=50)
+        parser.add_argument("--books", type=int, default=300)
+        parser.add_argument("--reviews-per-book", type=int, default=10, help="each book gets 1..N reviews")
+        parser.add_argument("--years", type=int, default=5, help="years of sales per book, up to --last-year")
+        parser.add_argument("--last-year", type=int, default=None, help="most recent sales year (default: this year)")
+        parser.add_argument("--seed", type=int, default=None, help="random seed, for reproducible data")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="books generated and inserted per batch")
+        parser.add_argument("--workers", type=int, default=None, help="generator processes (default: CPU count)")
+
+    def handle(self, *args, **options):
         db = get_db()
+        seed = options["seed"] if options["seed"] is not None else random.randrange(2**31)
+        # sales years end here; --seed and --last-year together reproduce a dataset in any year
+        last_year = options["last_year"] or date.today().year
 
         self.stdout.write("⚡ Dropping old collections...")
-        db.drop_collection("author")
-        db.drop_collection("book")
-        db.drop_collection("review")
-        db.drop_collection("sale")
-
-        self.stdout.write("⚡ Seeding Authors...")
-        authors = []
-        for _ in range(50):
-            author = Author(
-                name=faker.name(),
-                birthday=faker.date_of_birth(minimum_age=30, maximum_age=75),
-                origin_country=faker.country(),
-                description=faker.sentence(),
-            )
-            author.save()
-            authors.append(author)
-
-        self.stdout.write("⚡ Seeding Books + Reviews + Sales...")
-        for _ in range(300):
-            author = random.choice(authors)
-
-            book = Book(
-                name=" ".join(faker.words(3)),
-                summary=faker.paragraph(),
-                publication_date=faker.date_between(
-                    start_date="-30y", end_date="today"
-                ),
-                author=author,
-            )
-            book.save()
+        for model in (Author, Book, Review, Sale):
+            db.drop_collection(model._get_collection_name())
+            model.ensure_indexes()
 
-            # Reviews (1–10 per book)
-            for _ in range(random.randint(1, 10)):
-                Review(
-                    book=book,
-                    score=random.randint(1, 5),
-                    up_votes=random.randint(0, 5000),
-                ).save()
+        self.stdout.write(f"⚡ Seeding {options['authors']} Authors (seed {seed})...")
+        authors = generate_authors(options["authors"], seed)
+        Author._get_collection().insert_many(authors, ordered=False)
+        author_ids = [a["_id"] for a in authors]
 
-            # Sales (last 5 years)
-            total_sales = 0
-            current_year = date.today().year
-            for y in range(5):
-                year_sales = random.randint(1000, 100000)
-                total_sales += year_sales
-                Sale(book=book, year=current_year - y, count=year_sales).save()
+        self.stdout.write(f"⚡ Seeding {options['books']} Books + Reviews + Sales (last year {last_year})...")
+        chunks = iter_book_chunks(
+            author_ids,
+            options["books"],
+            options["reviews_per_book"],
+            options["years"],
+            seed,
+            last_year=last_year,
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+        )
+        done = 0
+        for books, reviews, sales in chunks:
+            insert_books(books, reviews, sales)
+            done += len(books)
+            self.stdout.write(f"   {done}/{options['books']} books")
 
-            book.total_sales = total_sales
-            book.save()
+        self.stdout.write("⚡ Building statistics...")
+        stats.rebuild_all()
+        bump_versions(*ENTITIES)
 
         print("Is Elasticsearch enabled?", ES_ENABLED)
         if not ES_ENABLED:
@@ -82,12 +86,10 @@ class Command(BaseCommand):
             return
 
         self.stdout.write(self.style.SUCCESS("✅ Seeding complete!"))
-        self.stdout.write("⚡ Indexing Books in Elasticsearch...")
-        bulk_index_books(Book.objects)
-        self.stdout.write("⚡ Indexing Authors in Elasticsearch...")
-        bulk_index_authors(Author.objects)
-        self.stdout.write("⚡ Indexing Reviews in Elasticsearch...")
-        bulk_index_reviews(Review.objects)
-        self.stdout.write("⚡ Indexing Sales in Elasticsearch...")
-        bulk_index_sales(Sale.objects)
+        for alias in INDEXES.values():
+            self.stdout.write(f"⚡ Indexing {alias} in Elasticsearch...")
+            try:
+                reindex(alias)
+            except ReindexError as e:
+                raise CommandError(str(e))
         self.stdout.write(self.style.SUCCESS("✅ Indexing complete!"))
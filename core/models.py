@@ -1,11 +1,28 @@
 import mongoengine as me
 
+# case-insensitive order of the authors table; its indexes are declared with the same one
+AUTHORS_TABLE_COLLATION = {'locale': 'en', 'strength': 2}
+
 class Author(me.Document):
     name = me.StringField(required=True, max_length=200, unique=True)
     birthday = me.DateField()
     origin_country = me.StringField(max_length=100)
     description = me.StringField()
     image = me.StringField()
+    # denormalized statistics, maintained by core.stats
+    books_published = me.IntField(default=0)
+    review_count = me.IntField(default=0)
+    score_sum = me.IntField(default=0)
+    total_sales = me.IntField(default=0)
+    meta = {
+        'indexes': [
+            # authors table: every sort is (field, _id), read backwards for descending
+            {'fields': ['name', '_id'], 'collation': AUTHORS_TABLE_COLLATION},
+            {'fields': ['origin_country', '_id'], 'collation': AUTHORS_TABLE_COLLATION},
+            {'fields': ['-books_published', '-_id'], 'collation': AUTHORS_TABLE_COLLATION},
+            {'fields': ['-total_sales', '-_id'], 'collation': AUTHORS_TABLE_COLLATION},
+        ]
+    }
 
     def __str__(self):
         return self.name
@@ -17,9 +34,22 @@ class Book(me.Document):
     summary = me.StringField()
     publication_date = me.DateField()
     cover_image = me.StringField()
+    # denormalized statistics, maintained by core.stats
+    review_count = me.IntField(default=0)
+    score_sum = me.IntField(default=0)
+    total_sales = me.IntField(default=0)
+    sales_by_year = me.DictField()
     meta = {
         'indexes': [
-            {'fields': ['author', 'name'], 'unique': True}
+            {'fields': ['author', 'name'], 'unique': True},
+            # books table: every sort is (field, _id), read backwards for descending
+            ('name', '_id'),
+            ('author', '_id'),
+            ('publication_date', '_id'),
+            # top selling books
+            ('-total_sales', '_id'),
+            # $text search over name and summary (one text index per collection)
+            {'fields': ['$name', '$summary'], 'weights': {'name': 3, 'summary': 1}, 'default_language': 'english'},
         ]
     }
 
@@ -31,6 +61,12 @@ class Review(me.Document):
     book = me.ReferenceField(Book, reverse_delete_rule=me.CASCADE, required=True)
     score = me.IntField(min_value=0, max_value=5, required=True)
     up_votes = me.IntField(default=0)
+    meta = {
+        'indexes': [
+            # book page order and the per-book best/worst review of the top rated ranking
+            ('book', '-score', '-up_votes'),
+        ]
+    }
 
 
 class Sale(me.Document):
@@ -39,6 +75,14 @@ class Sale(me.Document):
     year = me.IntField(required=True)
     meta = {
         'indexes': [
-            {'fields': ['book', 'year'], 'unique': True}
+            {'fields': ['book', 'year'], 'unique': True},
+            # per-year top sales refresh: the top N of a year read in index order
+            ('year', '-count', 'book'),
         ]
-    }
\ No newline at end of file
+    }
+
+
+class YearTopSales(me.Document):
+    # best selling books of each sales year, maintained by core.stats
+    year = me.IntField(required=True, unique=True)
+    books = me.ListField(me.ObjectIdField())
\ No newline at end of file
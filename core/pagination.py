@@ -0,0 +1,120 @@
+from datetime import datetime
+
+import mongoengine as me
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.core.paginator import Page, Paginator
+from django.utils.functional import cached_property
+
+
+# Sliceable view over a paged service call, so Paginator only fetches one page
+class PagedRows:
+    def __init__(self, fetch, count):
+        self._fetch = fetch
+        self._count = count
+
+    def count(self):
+        return self._count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = index.start or 0
+            limit = None if index.stop is None else max(index.stop - start, 0)
+            return self._fetch(start, limit)
+        return self._fetch(index, 1)[0]
+
+
+# Paginator for mongoengine QuerySets and PagedRows: counts in the database and
+# fetches only the requested page with skip/limit, instead of list()-ing everything.
+class MongoPaginator(Paginator):
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if isinstance(qs, (list, tuple)):
+            return len(qs)
+        if getattr(qs, "_query", None) == {}:
+            # unfiltered collection: metadata count instead of a scan
+            return qs._collection.estimated_document_count()
+        return qs.count()
+
+    def _get_page(self, object_list, number, paginator):
+        if hasattr(object_list, "select_related"):
+            # one query for the page plus one $in per referenced collection
+            object_list = object_list.select_related()
+        return Page(list(object_list), number, paginator)
+
+
+def page_number(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def prefetched_page(rows, count, number, per_page, refetch):
+    # Page from rows fetched together with their total count (e.g. by one $facet);
+    # a number past the end falls back to the last page, read with refetch(skip, limit)
+    paginator = Paginator(PagedRows(lambda start, limit: rows, lambda: count), per_page)
+    if number > paginator.num_pages:
+        number = paginator.num_pages
+        rows = refetch((number - 1) * per_page, per_page)
+    return paginator.page(number)
+
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+
+def _api_value(field, value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(field, me.DateField) and isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def keyset_query(model, params, fields):
+    # ?after=<id>&limit=<n>&fields=a,b -> (filter, fields to return, limit).
+    # Raises ValueError on bad parameters.
+    try:
+        limit = int(params.get("limit", API_PAGE_SIZE))
+        after = ObjectId(params["after"]) if params.get("after") else None
+    except (TypeError, ValueError, InvalidId):
+        raise ValueError("Invalid after or limit")
+    if not 0 < limit <= API_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {API_MAX_PAGE_SIZE}")
+
+    wanted = list(fields)
+    if params.get("fields"):
+        wanted = [f for f in params["fields"].split(",") if f and f != "id"]
+        unknown = set(wanted) - set(fields)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    query = {"_id": {"$gt": after}} if after else {}
+    return query, wanted, limit
+
+
+def projection(fields):
+    return {f: 1 for f in fields} or {"_id": 1}
+
+
+def api_row(model, doc, fields):
+    # raw document -> API row; reference fields stay as the stored id
+    row = {"id": str(doc["_id"])}
+    for f in fields:
+        row[f] = _api_value(model._fields[f], doc.get(f))
+    return row
+
+
+def keyset_page(model, params, fields):
+    # raw documents ordered by _id, without dereferencing.
+    # Returns (rows, next_after); raises ValueError on bad parameters.
+    query, wanted, limit = keyset_query(model, params, fields)
+    docs = model._get_collection().find(query, projection(wanted)).sort("_id", 1).limit(limit)
+    rows = [api_row(model, doc, wanted) for doc in docs]
+    next_after = rows[-1]["id"] if len(rows) == limit else None
+    return rows, next_after
@@ -1,154 +1,396 @@
+import logging
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, streaming_bulk
 from django.conf import settings
 
-es = Elasticsearch(settings.ELASTICSEARCH_URL)
+from core import index_queue
+from core.models import Author, Book, Review, Sale
+from core.stats import author_stats_stages
+
+logger = logging.getLogger(__name__)
 
+es = Elasticsearch(settings.ELASTICSEARCH_URL)
+ES_BULK_THREADS = getattr(settings, "ES_BULK_THREADS", 4)
+ES_BULK_CHUNK_SIZE = getattr(settings, "ES_BULK_CHUNK_SIZE", 500)
+ES_BULK_MAX_RETRIES = getattr(settings, "ES_BULK_MAX_RETRIES", 5)
+ES_BULK_INITIAL_BACKOFF = getattr(settings, "ES_BULK_INITIAL_BACKOFF", 2)
+ES_BULK_MAX_BACKOFF = getattr(settings, "ES_BULK_MAX_BACKOFF", 60)
+# Mongo documents read per batch by the bulk indexers
+READ_BATCH_SIZE = 5000
+ES_NUMBER_OF_REPLICAS = getattr(settings, "ES_NUMBER_OF_REPLICAS", 0)
+ES_REFRESH_INTERVAL = "1s"
+# index.max_result_window: from + size can't go past it
+ES_MAX_RESULT_WINDOW = 10000
 
-def index_book(book):
-    es.index(
-        index="books",
-        id=str(book.id),
-        document={
-            "name": book.name,
-            "summary": book.summary,
-            "author": book.author.name if book.author else None,
-            "publication_date": str(book.publication_date),
+# Explicit mappings for the versioned indexes (<alias>_v<N>) behind the books, authors,
+# reviews and sales aliases. Sortable text fields get a .keyword subfield, normalized so
+# sorting ignores case and accents like the Mongo tables.
+ANALYSIS = {
+    "filter": {
+        "english_stop": {"type": "stop", "stopwords": "_english_"},
+        "english_stemmer": {"type": "stemmer", "language": "english"},
+    },
+    "analyzer": {
+        "folding": {"type": "custom", "tokenizer": "standard", "filter": ["lowercase", "asciifolding"]},
+        "english_folding": {
+            "type": "custom",
+            "tokenizer": "standard",
+            "filter": ["lowercase", "asciifolding", "english_stop", "english_stemmer"],
         },
-    )
+    },
+    "normalizer": {
+        "folding": {"type": "custom", "filter": ["lowercase", "asciifolding"]},
+    },
+}
+_SORTABLE_TEXT = {
+    "type": "text",
+    "analyzer": "folding",
+    "fields": {"keyword": {"type": "keyword", "ignore_above": 256, "normalizer": "folding"}},
+}
+MAPPINGS = {
+    "books": {
+        "name": _SORTABLE_TEXT,
+        "author": _SORTABLE_TEXT,
+        "summary": {"type": "text", "analyzer": "english_folding"},
+        "publication_date": {"type": "date"},
+    },
+    "authors": {
+        "id": {"type": "keyword"},
+        "name": _SORTABLE_TEXT,
+        "country": _SORTABLE_TEXT,
+        "books_published": {"type": "integer"},
+        "avg_score": {"type": "float"},
+        "total_sales": {"type": "long"},
+    },
+    "reviews": {
+        "book": {"type": "keyword"},
+        "score": {"type": "integer"},
+        "up_votes": {"type": "integer"},
+    },
+    "sales": {
+        "book": {"type": "keyword"},
+        "count": {"type": "long"},
+        "year": {"type": "integer"},
+    },
+}
 
 
-def bulk_index_books(books):
-    actions = [
-        {
-            "_index": "books",
-            "_id": str(book.id),
-            "_source": {
-                "name": book.name,
-                "summary": book.summary,
-                "author": book.author.name if book.author else None,
-                "publication_date": str(book.publication_date),
-            },
-        }
-        for book in books
-    ]
-    bulk(es, actions)
+# Index documents built from raw Mongo documents
+INDEXES = {"author": "authors", "book": "books", "review": "reviews", "sale": "sales"}
+MODELS = {"author": Author, "book": Book, "review": Review, "sale": Sale}
 
 
-def index_author(author):
-    es.index(
-        index="authors",
-        id=str(author.id),
-        document={
-            "id": str(author.id),
-            "name": author.name,
-            "country": author.origin_country,  # <- match template
-            "books_published": getattr(author, "books_published", 0),
-            "avg_score": getattr(author, "avg_score", 0),
-            "total_sales": getattr(author, "total_sales", 0),
-        },
+def _id(value):
+    return str(value) if value is not None else None
+
+
+def _date(value):
+    return str(value.date()) if isinstance(value, datetime) else value
+
+
+def author_source(doc, names=None):
+    # doc is either an author_stats_stages() row or a stored author with its counters
+    review_count = doc.get("review_count") or 0
+    avg_score = doc.get("avg_score")
+    if avg_score is None:
+        avg_score = round(doc.get("score_sum", 0) / review_count, 2) if review_count else 0.0
+    return {
+        "id": str(doc["_id"]),
+        "name": doc.get("name"),
+        "country": doc.get("origin_country"),
+        "books_published": doc.get("books_published", 0),
+        "avg_score": avg_score,
+        "total_sales": doc.get("total_sales", 0),
+    }
+
+
+def book_source(doc, names):
+    return {
+        "name": doc.get("name"),
+        "summary": doc.get("summary"),
+        "author": names.get(doc.get("author")),
+        "publication_date": _date(doc.get("publication_date")),
+    }
+
+
+def review_source(doc, names=None):
+    return {"book": _id(doc.get("book")), "score": doc.get("score"), "up_votes": doc.get("up_votes", 0)}
+
+
+def sale_source(doc, names=None):
+    return {"book": _id(doc.get("book")), "count": doc.get("count"), "year": doc.get("year")}
+
+
+SOURCES = {"author": author_source, "book": book_source, "review": review_source, "sale": sale_source}
+
+
+def author_names(docs):
+    # one $in query for the authors of a batch of raw book documents
+    ids = list({d["author"] for d in docs if d.get("author")})
+    return {a["_id"]: a.get("name") for a in Author._get_collection().find({"_id": {"$in": ids}}, {"name": 1})}
+
+
+def _chunks(actions, size):
+    chunk = []
+    for action in actions:
+        chunk.append(action)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _send(chunk):
+    # streaming_bulk retries the documents ES rejects with 429, with exponential backoff
+    failed = 0
+    for ok, item in streaming_bulk(
+        es,
+        chunk,
+        chunk_size=len(chunk),
+        max_retries=ES_BULK_MAX_RETRIES,
+        initial_backoff=ES_BULK_INITIAL_BACKOFF,
+        max_backoff=ES_BULK_MAX_BACKOFF,
+        raise_on_error=False,
+    ):
+        if not ok:
+            failed += 1
+            logger.error("Bulk indexing failed: %s", item)
+    return failed
+
+
+def _bulk(actions):
+    # Sends ES_BULK_CHUNK_SIZE chunks of the (lazy) actions from ES_BULK_THREADS threads.
+    # At most two chunks per thread are in memory. Returns the number of failed documents.
+    failed = 0
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=ES_BULK_THREADS, thread_name_prefix="es-bulk") as pool:
+        for chunk in _chunks(actions, ES_BULK_CHUNK_SIZE):
+            pending.append(pool.submit(_send, chunk))
+            if len(pending) >= 2 * ES_BULK_THREADS:
+                failed += pending.popleft().result()
+        for future in pending:
+            failed += future.result()
+    return failed
+
+
+def _raw(queryset):
+    return queryset.as_pymongo().batch_size(READ_BATCH_SIZE)
+
+
+def _raw_batches(docs):
+    # raw documents (a cursor), READ_BATCH_SIZE at a time
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= READ_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _actions(entity, docs, index):
+    source = SOURCES[entity]
+    for docs in _raw_batches(docs):
+        names = author_names(docs) if entity == "book" else None
+        for doc in docs:
+            yield {"_index": index, "_id": str(doc["_id"]), "_source": source(doc, names)}
+
+
+def bulk_index_books(books, index="books"):
+    return _bulk(_actions("book", _raw(books), index))
+
+
+def bulk_index_authors(authors, index="authors"):
+    # figures computed from Book, Review and Sale in one aggregation, not read from the counters
+    rows = Author._get_collection().aggregate(
+        [{"$match": authors._query}] + author_stats_stages(),
+        allowDiskUse=True,
+        batchSize=READ_BATCH_SIZE,
     )
+    return _bulk(_actions("author", rows, index))
 
 
-def bulk_index_authors(authors):
-    actions = [
-        {
-            "_index": "authors",
-            "_id": str(author.id),
-            "_source": {
-                "id": str(author.id),
-                "name": author.name,
-                "country": author.origin_country,
-                "books_published": getattr(author, "books_published", 0),
-                "avg_score": getattr(author, "avg_score", 0),
-                "total_sales": getattr(author, "total_sales", 0),
-            },
-        }
-        for author in authors
-    ]
-    bulk(es, actions)
+def bulk_index_reviews(reviews, index="reviews"):
+    return _bulk(_actions("review", _raw(reviews), index))
 
 
-def index_review(review):
-    es.index(
-        index="reviews",
-        id=str(review.id),
-        document={
-            "book": str(review.book.id) if review.book else None,
-            "score": review.score,
-            "up_votes": review.up_votes,
-        },
+def bulk_index_sales(sales, index="sales"):
+    return _bulk(_actions("sale", _raw(sales), index))
+
+
+LOADERS = {
+    "books": (bulk_index_books, Book),
+    "authors": (bulk_index_authors, Author),
+    "reviews": (bulk_index_reviews, Review),
+    "sales": (bulk_index_sales, Sale),
+}
+
+
+def sync_actions(latest):
+    # {(entity, id): "index" | "delete"} -> bulk actions with the current Mongo state;
+    # an id that no longer exists in Mongo becomes a delete
+    actions = []
+    for entity, index in INDEXES.items():
+        ids = [doc_id for (e, doc_id), op in latest.items() if e == entity and op == "index"]
+        docs = list(MODELS[entity]._get_collection().find({"_id": {"$in": [ObjectId(i) for i in ids]}}))
+        names = author_names(docs) if entity == "book" else None
+        source = SOURCES[entity]
+        actions += [{"_index": index, "_id": str(d["_id"]), "_source": source(d, names)} for d in docs]
+        found = {str(d["_id"]) for d in docs}
+        actions += [
+            {"_op_type": "delete", "_index": index, "_id": doc_id}
+            for (e, doc_id), op in latest.items()
+            if e == entity and (op == "delete" or doc_id not in found)
+        ]
+    return actions
+
+
+def sync_bulk(latest):
+    # applies sync_actions(latest) in one bulk call; returns (ok, errors).
+    # Deleting a document ES never had (404) is not an error.
+    ok, errors = bulk(
+        es,
+        sync_actions(latest),
+        raise_on_error=False,
+        max_retries=ES_BULK_MAX_RETRIES,
+        initial_backoff=ES_BULK_INITIAL_BACKOFF,
+        max_backoff=ES_BULK_MAX_BACKOFF,
     )
+    return ok, [e for e in errors if next(iter(e.values())).get("status") != 404]
 
 
-def bulk_index_reviews(reviews):
-    actions = [
-        {
-            "_index": "reviews",
-            "_id": str(review.id),
-            "_source": {
-                "book": str(review.book.id) if review.book else None,
-                "score": review.score,
-                "up_votes": review.up_votes,
-            },
-        }
-        for review in reviews
-    ]
-    bulk(es, actions)
+def index_versions(alias):
+    # version numbers of the existing <alias>_v<N> indexes, ascending
+    names = es.indices.get(index=f"{alias}_v*", allow_no_indices=True, ignore_unavailable=True)
+    return sorted(int(name.rsplit("_v", 1)[1]) for name in names if name.rsplit("_v", 1)[1].isdigit())
 
 
-def index_sale(sale):
-    es.index(
-        index="sales",
-        id=str(sale.id),
-        document={
-            "book": str(sale.book.id) if sale.book else None,
-            "count": sale.count,
-            "year": sale.year,
-        },
+class ReindexError(Exception):
+    pass
+
+
+def _replay(alias, start):
+    # The queue worker kept applying changes to the old index during the load, and the
+    # load may have read some of those documents before they changed. Now that the alias
+    # points at the new index, apply every change queued since the load started again.
+    entity = next(e for e, a in INDEXES.items() if a == alias)
+    end = index_queue.last_seq()
+    rows = [r for r in index_queue.since(start) if r[0] <= end]
+    if len(rows) < end - start:
+        logger.warning(
+            "%d queued ES updates since the %s load started were dropped from the history "
+            "(ES_QUEUE_HISTORY_SECONDS); they may be missing from the new index",
+            end - start - len(rows), alias,
+        )
+    latest = index_queue.coalesce([r for r in rows if r[1] == entity])
+    if latest:
+        _, errors = sync_bulk(latest)
+        for error in errors:
+            logger.error("Replaying %s after the reindex failed: %s", alias, error)
+
+
+def reindex(alias, keep=1):
+    # Loads a new <alias>_v<N+1> from Mongo with refresh and replicas off, restores them,
+    # then moves the alias in one atomic update. Keeps the `keep` previous versions.
+    # Returns the new index name. If the load fails (ReindexError when some documents were
+    # rejected), the new index is dropped and the alias stays where it was.
+    start = index_queue.last_seq()
+    versions = index_versions(alias)
+    new = f"{alias}_v{versions[-1] + 1 if versions else 1}"
+    es.indices.create(
+        index=new,
+        settings={"number_of_replicas": 0, "refresh_interval": "-1", "analysis": ANALYSIS},
+        mappings={"properties": MAPPINGS[alias]},
     )
+    load, model = LOADERS[alias]
+    try:
+        failed = load(model.objects, new)
+        if failed:
+            raise ReindexError(f"{failed} documents failed to index into {new}; {alias} was not moved")
+        es.indices.put_settings(
+            index=new,
+            settings={"refresh_interval": ES_REFRESH_INTERVAL, "number_of_replicas": ES_NUMBER_OF_REPLICAS},
+        )
+        es.indices.refresh(index=new)
+        es.cluster.health(index=new, wait_for_status="yellow")
+    except Exception:
+        # a half-loaded index would later count as a rollback version
+        es.indices.delete(index=new, ignore_unavailable=True)
+        raise
 
+    actions = [{"add": {"index": new, "alias": alias}}]
+    if es.indices.exists_alias(name=alias):
+        actions += [{"remove": {"index": old, "alias": alias}} for old in es.indices.get_alias(name=alias)]
+    elif es.indices.exists(index=alias):
+        # a concrete index from before aliases: replaced in the same atomic update
+        actions.append({"remove_index": {"index": alias}})
+    es.indices.update_aliases(actions=actions)
+    _replay(alias, start)
 
-def bulk_index_sales(sales):
-    actions = [
-        {
-            "_index": "sales",
-            "_id": str(sale.id),
-            "_source": {
-                "book": str(sale.book.id) if sale.book else None,
-                "count": sale.count,
-                "year": sale.year,
-            },
-        }
-        for sale in sales
-    ]
-    bulk(es, actions)
+    for version in versions[:max(len(versions) - keep, 0)]:
+        es.indices.delete(index=f"{alias}_v{version}", ignore_unavailable=True)
+    return new
 
 
-def search_books(query, sort="name", order="asc"):
-    sort_field = f"{sort}.keyword" if sort in ["name", "author"] else sort
-    sort_clause = [{sort_field: {"order": order}}] if sort else None
+# books table sort keys (see frontend BOOK_SORT_FIELDS) -> ES fields
+BOOK_SORT_FIELDS = {
+    "name": "name.keyword",
+    "author": "author.keyword",
+    "date": "publication_date",
+}
 
-    res = es.search(
-        index="books",
-        query={
+
+def book_search_request(query, sort="name", order="asc"):
+    sort_field = BOOK_SORT_FIELDS.get(sort, BOOK_SORT_FIELDS["name"])
+    order = "desc" if order == "desc" else "asc"
+    sort_clause = [{sort_field: {"order": order}}] if sort else None
+    return {
+        "index": "books",
+        "query": {
             "multi_match": {
                 "query": query,
                 "fields": ["name", "author", "summary"],
                 "fuzziness": "AUTO",
             }
         },
-        sort=sort_clause,
-        size=100,
-    )
+        "sort": sort_clause,
+        "size": 100,
+    }
+
+
+def hits(res):
     return [{**hit["_source"], "id": hit["_id"]} for hit in res["hits"]["hits"]]
 
 
-def search_authors(query, sort="name", order="asc"):
-    sort_field = f"{sort}.keyword" if sort in ["name", "country"] else sort
+def search_books(query, sort="name", order="asc"):
+    return hits(es.search(**book_search_request(query, sort, order)))
 
-    sort_clause = [{sort_field: {"order": order}}] if sort else None
 
+# authors table sort keys (see services.AUTHOR_SORT_FIELDS) -> ES fields
+AUTHOR_SORT_FIELDS = {
+    "name": "name.keyword",
+    "country": "country.keyword",
+    "books": "books_published",
+    "score": "avg_score",
+    "sales": "total_sales",
+}
+
+
+def _author_sort(sort, order):
+    field = AUTHOR_SORT_FIELDS.get(sort, AUTHOR_SORT_FIELDS["name"])
+    order = "desc" if order == "desc" else "asc"
+    return [{field: {"order": order}}, {"id": {"order": order}}]
+
+
+def search_authors(query, sort="name", order="asc"):
     res = es.search(
         index="authors",
         query={
@@ -158,11 +400,50 @@ def search_authors(query, sort="name", order="asc"):
                 "fuzziness": "AUTO",
             }
         },
-        sort=sort_clause,
+        sort=_author_sort(sort, order) if sort else None,
         size=100,
     )
 
-    return [{**hit["_source"], "id": hit["_id"]} for hit in res["hits"]["hits"]]
+    return hits(res)
+
+
+def _contains(field, value):
+    # case-insensitive substring, like the $regex filters of services._authors_match
+    pattern = re.sub(r"([*?\\])", r"\\\1", value)
+    return {"wildcard": {field: {"value": f"*{pattern}*", "case_insensitive": True}}}
+
+
+def _authors_table_query(filters):
+    # each filled-in filter must match its own field
+    clauses = [
+        _contains(field, filters[key])
+        for key, field in (("name", "name.keyword"), ("country", "country.keyword"))
+        if filters.get(key)
+    ]
+    return {"bool": {"filter": clauses}} if clauses else {"match_all": {}}
+
+
+def search_authors_table(filters, sort="name", order="asc", skip=0, limit=20):
+    # one sorted page of the authors table; pages past ES_MAX_RESULT_WINDOW are empty
+    # (count_authors_table stops there, so the paginator never links to them)
+    size = min(limit, ES_MAX_RESULT_WINDOW - skip)
+    if size <= 0:
+        return []
+    res = es.search(
+        index="authors",
+        query=_authors_table_query(filters),
+        sort=_author_sort(sort, order),
+        from_=skip,
+        size=size,
+        track_total_hits=False,
+    )
+    return hits(res)
+
+
+def count_authors_table(filters):
+    # capped at ES_MAX_RESULT_WINDOW: a narrower filter is needed to page further
+    count = es.count(index="authors", query=_authors_table_query(filters))["count"]
+    return min(count, ES_MAX_RESULT_WINDOW)
 
 
 def search_reviews(query):
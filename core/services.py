@@ -1,151 +1,224 @@
-from mongoengine.queryset.visitor import Q
-from core.models import Author, Book, Review, Sale
-from django.core.cache import cache
-from django.conf import settings
-
-CACHE_ENABLED = getattr(settings, "CACHE_ENABLED", False)
-
-def cache_get_or_set(key, func, timeout=300):
-    if CACHE_ENABLED:
-        result = cache.get(key)
-        if result is not None:
-            return result
-        result = func()
-        cache.set(key, result, timeout=timeout)
-        return result
+import re
+from urllib.parse import urlencode
+from pymongo.errors import OperationFailure
+from core.models import AUTHORS_TABLE_COLLATION, Author, Book, Review, YearTopSales
+from core.stats import avg_score_expr
+from core.cache import cache_get_or_set
+from sa_library.db import analytics_collection
+
+SEARCH_LIMIT = 100
+INDEX_NOT_FOUND = 27
+
+AUTHOR_SORT_FIELDS = {
+    "name": "name",
+    "country": "origin_country",
+    "books": "books_published",
+    "score": "avg_score",
+    "sales": "total_sales",
+}
+
+
+def _filters_key(filters: dict):
+    # urlencoded, so a value containing & or = can't collide with another filter
+    return urlencode(sorted((k, v) for k, v in filters.items() if v))
+
+
+def _authors_match(filters: dict):
+    match = {}
+    if filters.get("name"):
+        match["name"] = {"$regex": re.escape(filters["name"]), "$options": "i"}
+    if filters.get("country"):
+        match["origin_country"] = {"$regex": re.escape(filters["country"]), "$options": "i"}
+    return match
+
+
+AUTHOR_ROW_PROJECTION = {"$project": {
+    "_id": 0,
+    "id": {"$toString": "$_id"},
+    "name": 1,
+    "country": {"$ifNull": ["$origin_country", ""]},
+    "books_published": 1,
+    "avg_score": 1,
+    "total_sales": 1,
+}}
+
+
+def _author_lookup(local_field, *fields):
+    return {"$lookup": {
+        "from": Author._get_collection_name(),
+        "localField": local_field,
+        "foreignField": "_id",
+        "pipeline": [{"$project": {"_id": 0, **{f: 1 for f in fields}}}],
+        "as": "author",
+    }}
+
+
+def _authors_sort(sort: str | None, order: str | None):
+    return AUTHOR_SORT_FIELDS.get(sort or "name", "name"), -1 if order == "desc" else 1
+
+
+def authors_table_pipeline(filters: dict, sort: str | None, order: str | None, skip: int = 0, limit: int | None = None):
+    sort_field, direction = _authors_sort(sort, order)
+    page = [{"$sort": {sort_field: direction, "_id": direction}}]
+    if skip:
+        page.append({"$skip": int(skip)})
+    if limit:
+        page.append({"$limit": int(limit)})
+
+    pipeline = [{"$match": _authors_match(filters)}]
+    stats = [{"$addFields": {"avg_score": avg_score_expr()}}]
+    if sort_field == "avg_score":
+        pipeline += stats + page
     else:
-        return func()
+        # stored sort key: page first, so only the shown authors get avg_score computed
+        pipeline += page + stats
+    pipeline.append(AUTHOR_ROW_PROJECTION)
+    return pipeline
 
-def get_authors_table(filters: dict, sort: str | None, order: str | None):
-    key = f"authors_table:{filters}:{sort}:{order}"
+
+def get_authors_table(filters: dict, sort: str | None, order: str | None, skip: int = 0, limit: int | None = None):
+    sort_field, direction = _authors_sort(sort, order)
+    key = f"authors_table:{_filters_key(filters)}:{sort_field}:{direction}:{skip}:{limit}"
+    def compute():
+        coll = analytics_collection(Author)
+        pipeline = authors_table_pipeline(filters, sort, order, skip, limit)
+        return list(coll.aggregate(pipeline, collation=AUTHORS_TABLE_COLLATION))
+    return cache_get_or_set(key, compute, depends_on=("author", "stats"))
+
+def count_authors(filters: dict):
+    key = f"authors_count:{_filters_key(filters)}"
     def compute():
-        qs = Author.objects
-        if filters.get("name"):
-            qs = qs.filter(name__icontains=filters["name"])
-        if filters.get("country"):
-            qs = qs.filter(origin_country__icontains=filters["country"])
-
-        authors = list(qs)
-        enriched = []
-
-        for a in authors:
-            books_qs = Book.objects(author=a).only("id")
-            book_ids = [b.id for b in books_qs]
-            books_count = len(book_ids)
-
-            if book_ids:
-                rev_qs = Review.objects(book__in=book_ids).only("score")
-                total_scores = sum(r.score for r in rev_qs)
-                n_reviews = rev_qs.count()
-                avg_score = (total_scores / n_reviews) if n_reviews else 0.0
-            else:
-                avg_score = 0.0
-
-            total_sales = 0
-            if book_ids:
-                total_sales = sum(s.count for s in Sale.objects(book__in=book_ids).only("count"))
-
-            enriched.append({
-                "id": str(a.id),
-                "name": a.name,
-                "country": a.origin_country or "",
-                "books_published": books_count,
-                "avg_score": round(avg_score, 2),
-                "total_sales": total_sales,
-            })
-
-        key_map = {
-            "name": lambda x: x["name"].lower(),
-            "country": lambda x: (x["country"] or "").lower(),
-            "books": lambda x: x["books_published"],
-            "score": lambda x: x["avg_score"],
-            "sales": lambda x: x["total_sales"],
-        }
-        key_sort = key_map.get((sort or "name"), key_map["name"])
-        reverse = (order == "desc")
-        enriched.sort(key=key_sort, reverse=reverse)
-        return enriched
-    return cache_get_or_set(key, compute, timeout=600)
+        return analytics_collection(Author).count_documents(_authors_match(filters))
+    return cache_get_or_set(key, compute, depends_on=("author",))
+
+def top_rated_pipeline(limit):
+    review_fields = {"score": "$score", "up_votes": "$up_votes"}
+    return [
+        # within each book, best review first and worst review last
+        {"$sort": {"book": 1, "score": -1, "up_votes": -1}},
+        {"$group": {
+            "_id": "$book",
+            "avg_score": {"$avg": "$score"},
+            "best": {"$first": review_fields},
+            "worst": {"$last": review_fields},
+        }},
+        {"$sort": {"avg_score": -1, "_id": 1}},
+        {"$limit": int(limit)},
+        {"$lookup": {
+            "from": Book._get_collection_name(),
+            "localField": "_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"name": 1, "author": 1}}],
+            "as": "book",
+        }},
+        {"$unwind": "$book"},
+        _author_lookup("book.author", "name"),
+        {"$project": {
+            "_id": 0,
+            "book": {
+                "id": {"$toString": "$book._id"},
+                "name": "$book.name",
+                "author": {"name": {"$first": "$author.name"}},
+            },
+            "avg_score": 1,
+            "best": 1,
+            "worst": 1,
+        }},
+    ]
+
 
 def get_top_rated_books(limit=10):
     key = f"top_rated_books:{limit}"
     def compute():
-        coll = Review._get_collection()
-        pipeline = [
-            {"$group": {"_id": "$book", "avg_score": {"$avg": "$score"}}},
-            {"$sort": {"avg_score": -1, "_id": 1}},
-            {"$limit": int(limit)},
-        ]
-        ranks = list(coll.aggregate(pipeline))
-
-        items = []
-        for row in ranks:
-            book = Book.objects(id=row["_id"]).first()
-            if not book:
-                continue
-            best = Review.objects(book=book).order_by("-score", "-up_votes").first()
-            worst = Review.objects(book=book).order_by("score", "up_votes").first()
-            items.append({
-                "book": book,
-                "avg_score": row["avg_score"],
-                "best": best,
-                "worst": worst,
-            })
-        return items
-    return cache_get_or_set(key, compute, timeout=600)
+        coll = analytics_collection(Review)
+        return list(coll.aggregate(top_rated_pipeline(limit), allowDiskUse=True))
+    return cache_get_or_set(key, compute, depends_on=("author", "book", "review"))
+
+def top_selling_pipeline(limit):
+    return [
+        {"$match": {"total_sales": {"$gt": 0}}},
+        {"$sort": {"total_sales": -1, "_id": 1}},
+        {"$limit": int(limit)},
+        _author_lookup("author", "name", "total_sales"),
+        {"$project": {
+            "name": 1,
+            "total_sales": 1,
+            "pub_year": {"$year": "$publication_date"},
+            "author": {"$first": "$author"},
+        }},
+    ]
+
+
+def top_selling_rows(books, year_top_sales):
+    # year_top_sales: YearTopSales documents covering (at least) the books' publication years
+    top_by_year = {row["year"]: set(row["books"]) for row in year_top_sales}
+    items = []
+    for b in books:
+        author = b.get("author") or {}
+        items.append({
+            "book": {"id": str(b["_id"]), "name": b["name"], "author": {"name": author.get("name")}},
+            "total_book_sales": b["total_sales"],
+            "author_total_sales": author.get("total_sales", 0),
+            "in_top5_pub_year": b["_id"] in top_by_year.get(b.get("pub_year"), ()),
+        })
+    return items
+
 
 def get_top_selling_books(limit=50):
     key = f"top_selling_books:{limit}"
     def compute():
-        coll = Sale._get_collection()
-        pipeline = [
-            {"$group": {"_id": "$book", "total_book_sales": {"$sum": "$count"}}},
-            {"$sort": {"total_book_sales": -1, "_id": 1}},
-            {"$limit": int(limit)},
-        ]
-        rows = list(coll.aggregate(pipeline))
-
-        items = []
-        for r in rows:
-            book = Book.objects(id=r["_id"]).first()
-            if not book:
-                continue
-
-            author_book_ids = [b.id for b in Book.objects(author=book.author).only("id")]
-            author_total_sales = 0
-            if author_book_ids:
-                author_total_sales = sum(s.count for s in Sale.objects(book__in=author_book_ids).only("count"))
-
-            in_top5_pub_year = False
-            pub_year = book.publication_date.year if book.publication_date else None
-            if pub_year:
-                year_pipeline = [
-                    {"$match": {"year": int(pub_year)}},
-                    {"$group": {"_id": "$book", "s": {"$sum": "$count"}}},
-                    {"$sort": {"s": -1, "_id": 1}},
-                    {"$limit": 5},
-                ]
-                top5 = list(Sale._get_collection().aggregate(year_pipeline))
-                top5_ids = {row["_id"] for row in top5}
-                in_top5_pub_year = (book.id in top5_ids)
-
-            items.append({
-                "book": book,
-                "total_book_sales": r.get("total_book_sales", 0),
-                "author_total_sales": author_total_sales,
-                "in_top5_pub_year": in_top5_pub_year,
-            })
-        return items
-    return cache_get_or_set(key, compute, timeout=600)
-
-def search_books_by_summary(q: str):
-    key = f"search_books:{q}"
+        books = list(analytics_collection(Book).aggregate(top_selling_pipeline(limit)))
+        pub_years = {b["pub_year"] for b in books if b.get("pub_year")}
+        year_top_sales = analytics_collection(YearTopSales).find({"year": {"$in": list(pub_years)}})
+        return top_selling_rows(books, year_top_sales)
+    return cache_get_or_set(key, compute, depends_on=("author", "book", "sale", "stats"))
+
+def _text_search_pipeline(q, limit):
+    # ranked by the name/summary text index
+    return [
+        {"$match": {"$text": {"$search": q}}},
+        {"$sort": {"score": {"$meta": "textScore"}, "_id": 1}},
+        {"$limit": int(limit)},
+    ]
+
+
+def _regex_search_pipeline(words, limit):
+    match = {}
+    if words:
+        match = {"$or": [{"summary": {"$regex": re.escape(w), "$options": "i"}} for w in words]}
+    return [{"$match": match}, {"$sort": {"name": 1}}, {"$limit": int(limit)}]
+
+
+SEARCH_ROW_STAGES = [
+    _author_lookup("author", "name"),
+    {"$project": {
+        "_id": 0,
+        "id": {"$toString": "$_id"},
+        "name": 1,
+        "summary": 1,
+        "author": {"$first": "$author.name"},
+    }},
+]
+
+
+def search_pipelines(q, limit):
+    # (text index pipeline or None, regex fallback pipeline)
+    words = [w for w in q.split() if w]
+    text = _text_search_pipeline(q, limit) + SEARCH_ROW_STAGES if words else None
+    return text, _regex_search_pipeline(words, limit) + SEARCH_ROW_STAGES
+
+
+def search_books_by_summary(q: str, limit: int = SEARCH_LIMIT):
+    key = f"search_books:{q}:{limit}"
     def compute():
-        if not q:
-            return Book.objects.order_by("name")
-        words = [w for w in q.split() if w]
-        cond = Q()
-        for w in words:
-            cond |= Q(summary__icontains=w)
-        return Book.objects(cond).order_by("name")
-    return cache_get_or_set(key, compute, timeout=300)
+        text, regex = search_pipelines(q, limit)
+        coll = analytics_collection(Book)
+        if text:
+            try:
+                return list(coll.aggregate(text))
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    raise
+                # no text index on this database: slower regex scan
+        return list(coll.aggregate(regex))
+    return cache_get_or_set(key, compute, depends_on=("author", "book"))
@@ -0,0 +1,71 @@
+from django.conf import settings
+from mongoengine import signals
+
+from core import index_queue, stats
+from core.cache import bump_versions
+from core.models import Author, Book, Review, Sale
+
+ES_ENABLED = getattr(settings, "ES_ENABLED", False)
+
+
+def _bump_cache_version(sender, document, **kwargs):
+    bump_versions(sender._get_collection_name())
+
+
+def _enqueue_index(sender, document, **kwargs):
+    index_queue.enqueue(sender._get_collection_name(), document.id, index_queue.INDEX)
+
+
+def _enqueue_delete(sender, document, **kwargs):
+    index_queue.enqueue(sender._get_collection_name(), document.id, index_queue.DELETE)
+
+
+def _enqueue_author_books(sender, document, created=False, **kwargs):
+    # book documents carry their author's name: reindex them when it changes
+    if created or "name" not in document._get_changed_fields():
+        return
+    book_ids = Book._get_collection().distinct("_id", {"author": document.id})
+    index_queue.enqueue_many(("book", book_id, index_queue.INDEX) for book_id in book_ids)
+
+
+def _delete_all(model, query):
+    # raw delete of the matching documents, without loading them or sending signals
+    coll = model._get_collection()
+    if ES_ENABLED:
+        ids = [d["_id"] for d in coll.find(query, {"_id": 1})]
+        index_queue.enqueue_many((model._get_collection_name(), i, index_queue.DELETE) for i in ids)
+    coll.delete_many(query)
+
+
+def _delete_children(sender, document, **kwargs):
+    # Runs before mongoengine's CASCADE. Review and Sale have delete receivers, so CASCADE
+    # would load and delete them one at a time; remove them here with one query per
+    # collection and bump each version once. CASCADE then finds nothing left to delete.
+    if sender is Author:
+        book_ids = Book._get_collection().distinct("_id", {"author": document.id})
+    else:
+        book_ids = [document.id]
+    years = Sale._get_collection().distinct("year", {"book": {"$in": book_ids}}) if sender is Author else []
+    _delete_all(Review, {"book": {"$in": book_ids}})
+    _delete_all(Sale, {"book": {"$in": book_ids}})
+    entities = ["review", "sale"]
+    if sender is Author:
+        _delete_all(Book, {"_id": {"$in": book_ids}})
+        entities.append("book")
+        # the books' sales leave the yearly top lists (a single book delete does this in stats.book_removed)
+        stats.refresh_year_top_sales(years)
+    bump_versions(*entities)
+
+
+for model in (Author, Book, Review, Sale):
+    signals.post_save.connect(_bump_cache_version, sender=model)
+    signals.post_delete.connect(_bump_cache_version, sender=model)
+    if ES_ENABLED:
+        signals.post_save.connect(_enqueue_index, sender=model)
+        signals.post_delete.connect(_enqueue_delete, sender=model)
+
+for model in (Author, Book):
+    signals.pre_delete.connect(_delete_children, sender=model)
+
+if ES_ENABLED:
+    signals.post_save.connect(_enqueue_author_books, sender=Author)
@@ -0,0 +1,104 @@
+import gzip
+import json
+import os
+from datetime import date
+
+import bson
+import faker
+from mongoengine.connection import get_db
+
+from core.datagen import generate_authors, iter_book_chunks
+from core.models import Author, Book, Review, Sale
+
+# A snapshot is a directory with one gzipped BSON file per collection (the same
+# layout `mongodump --gzip` writes, so `mongorestore --gzip --dir` can load it too)
+# plus a manifest.json recording how it was generated.
+
+MODELS = (Author, Book, Review, Sale)
+MANIFEST = "manifest.json"
+
+
+def _path(directory, model):
+    return os.path.join(directory, f"{model._get_collection_name()}.bson.gz")
+
+
+def exists(directory):
+    return os.path.exists(os.path.join(directory, MANIFEST))
+
+
+def write_snapshot(directory, authors, books, reviews_per_book, years, seed,
+                   last_year=None, chunk_size=5000, workers=None, log=print):
+    last_year = last_year or date.today().year
+    os.makedirs(directory, exist_ok=True)
+    files = {m: gzip.open(_path(directory, m), "wb") for m in MODELS}
+    counts = dict.fromkeys((m._get_collection_name() for m in MODELS), 0)
+    try:
+        author_docs = generate_authors(authors, seed)
+        _write(files[Author], author_docs)
+        counts["author"] = len(author_docs)
+
+        # (author, name) is unique; skip generated duplicates so the snapshot always loads cleanly
+        seen = set()
+        chunks = iter_book_chunks(
+            [a["_id"] for a in author_docs], books, reviews_per_book, years, seed,
+            last_year=last_year, chunk_size=chunk_size, workers=workers,
+        )
+        for book_docs, review_docs, sale_docs in chunks:
+            dropped = set()
+            kept = []
+            for b in book_docs:
+                key = (b["author"], b["name"])
+                if key in seen:
+                    dropped.add(b["_id"])
+                else:
+                    seen.add(key)
+                    kept.append(b)
+            for model, docs in ((Book, kept), (Review, review_docs), (Sale, sale_docs)):
+                docs = [d for d in docs if d.get("book") not in dropped]
+                _write(files[model], docs)
+                counts[model._get_collection_name()] += len(docs)
+            log(f"   {counts['book']} books written")
+    finally:
+        for f in files.values():
+            f.close()
+
+    manifest = {
+        "seed": seed,
+        "authors": authors,
+        "books": books,
+        "reviews_per_book": reviews_per_book,
+        "years": years,
+        "last_year": last_year,
+        "faker": faker.VERSION,
+        "counts": counts,
+    }
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _write(f, docs):
+    for doc in docs:
+        f.write(bson.encode(doc))
+
+
+def load_snapshot(directory, batch_size=10_000, log=print):
+    # replaces the four collections with the snapshot contents
+    db = get_db()
+    for model in MODELS:
+        db.drop_collection(model._get_collection_name())
+        model.ensure_indexes()
+        coll = model._get_collection()
+        total = 0
+        batch = []
+        with gzip.open(_path(directory, model), "rb") as f:
+            for doc in bson.decode_file_iter(f):
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    coll.insert_many(batch, ordered=False)
+                    total += len(batch)
+                    batch = []
+        if batch:
+            coll.insert_many(batch, ordered=False)
+            total += len(batch)
+        log(f"   {total} {model._get_collection_name()} documents loaded")
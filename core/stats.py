@@ -0,0 +1,201 @@
+from collections import defaultdict
+
+from django.conf import settings
+from pymongo import DeleteOne, UpdateOne
+
+from core import index_queue
+from core.cache import bump_versions
+from core.models import Author, Book, Review, Sale, YearTopSales
+
+BOOK_STATS_ZERO = {"review_count": 0, "score_sum": 0, "total_sales": 0, "sales_by_year": {}}
+AUTHOR_STATS_ZERO = {"books_published": 0, "review_count": 0, "score_sum": 0, "total_sales": 0}
+TOP_SALES_PER_YEAR = 5
+ES_ENABLED = getattr(settings, "ES_ENABLED", False)
+
+
+def ref_id(doc, field):
+    # id of a ReferenceField without dereferencing it (DBRef and Document both expose .id)
+    value = doc._data.get(field)
+    return getattr(value, "id", value)
+
+
+def _inc(model, doc_id, fields):
+    fields = {k: v for k, v in fields.items() if v}
+    if doc_id is None or not fields:
+        return
+    model._get_collection().update_one({"_id": doc_id}, {"$inc": fields})
+    _counters_changed(model, [doc_id])
+
+
+def _counters_changed(model, ids):
+    # $inc sends no signal: retire the cached results built on the old counters (the save
+    # signal bumped before they changed) and queue the ES author documents that carry them.
+    # Only the "stats" token: results that don't read counters stay cached.
+    bump_versions("stats")
+    if model is Author and ES_ENABLED:
+        index_queue.enqueue_many(("author", author_id, index_queue.INDEX) for author_id in ids)
+
+
+def review_changed(book, score, sign=1):
+    # sign=1 when a review is added to book, -1 when it is removed
+    fields = {"review_count": sign, "score_sum": sign * int(score or 0)}
+    _inc(Book, book.id, fields)
+    _inc(Author, ref_id(book, "author"), fields)
+
+
+def sales_changed(book, year, delta):
+    # delta is the change in units sold for (book, year); negative on edits/deletes
+    delta = int(delta or 0)
+    _inc(Book, book.id, {"total_sales": delta, f"sales_by_year.{int(year)}": delta})
+    _inc(Author, ref_id(book, "author"), {"total_sales": delta})
+    refresh_year_top_sales([year])
+
+
+def _inc_many(model, increments):
+    changed = [doc_id for doc_id, fields in increments.items() if doc_id is not None and any(fields.values())]
+    ops = [UpdateOne({"_id": doc_id}, {"$inc": {k: v for k, v in increments[doc_id].items() if v}}) for doc_id in changed]
+    if ops:
+        model._get_collection().bulk_write(ops, ordered=False)
+        _counters_changed(model, changed)
+
+
+def reviews_added(rows):
+    # bulk version of review_changed; rows are (book_id, author_id, score)
+    books = defaultdict(lambda: defaultdict(int))
+    authors = defaultdict(lambda: defaultdict(int))
+    for book_id, author_id, score in rows:
+        for target in (books[book_id], authors[author_id]):
+            target["review_count"] += 1
+            target["score_sum"] += int(score)
+    _inc_many(Book, books)
+    _inc_many(Author, authors)
+
+
+def sales_added(rows):
+    # bulk version of sales_changed; rows are (book_id, author_id, year, delta)
+    books = defaultdict(lambda: defaultdict(int))
+    authors = defaultdict(lambda: defaultdict(int))
+    years = set()
+    for book_id, author_id, year, delta in rows:
+        books[book_id]["total_sales"] += int(delta)
+        books[book_id][f"sales_by_year.{int(year)}"] += int(delta)
+        authors[author_id]["total_sales"] += int(delta)
+        years.add(int(year))
+    _inc_many(Book, books)
+    _inc_many(Author, authors)
+    refresh_year_top_sales(years)
+
+
+def book_changed(book, author_id, sign=1):
+    # counts book (and the stats it already carries) for or against author_id
+    _inc(Author, author_id, {
+        "books_published": sign,
+        "review_count": sign * (book.review_count or 0),
+        "score_sum": sign * (book.score_sum or 0),
+        "total_sales": sign * (book.total_sales or 0),
+    })
+
+
+def book_removed(book):
+    # book was deleted; its reviews and sales went with it (CASCADE)
+    book_changed(book, ref_id(book, "author"), -1)
+    refresh_year_top_sales(book.sales_by_year or {})
+
+
+def refresh_year_top_sales(years=None):
+    # keep the top books of each sales year; years=None rebuilds every year.
+    # Each year is one indexed top-N read on (year, -count, book), not a sort of the year.
+    sales = Sale._get_collection()
+    top = YearTopSales._get_collection()
+    if years is None:
+        years = sales.distinct("year")
+        top.delete_many({"year": {"$nin": years}})
+    ops = []
+    for year in {int(y) for y in years}:
+        books = [
+            s["book"]
+            for s in sales.find({"year": year}, {"_id": 0, "book": 1})
+            .sort([("count", -1), ("book", 1)])
+            .limit(TOP_SALES_PER_YEAR)
+        ]
+        if books:
+            ops.append(UpdateOne({"year": year}, {"$set": {"books": books}}, upsert=True))
+        else:
+            # no sale left in that year
+            ops.append(DeleteOne({"year": year}))
+    if ops:
+        top.bulk_write(ops, ordered=False)
+    bump_versions("stats")
+
+
+def author_stats_stages():
+    # books_published / review_count / score_sum / avg_score / total_sales per author
+    return [
+        {"$lookup": {
+            "from": Book._get_collection_name(),
+            "localField": "_id",
+            "foreignField": "author",
+            "pipeline": [{"$project": {"_id": 1}}],
+            "as": "books",
+        }},
+        {"$lookup": {
+            "from": Review._get_collection_name(),
+            "localField": "books._id",
+            "foreignField": "book",
+            "pipeline": [{"$group": {"_id": None, "n": {"$sum": 1}, "total": {"$sum": "$score"}}}],
+            "as": "reviews",
+        }},
+        {"$lookup": {
+            "from": Sale._get_collection_name(),
+            "localField": "books._id",
+            "foreignField": "book",
+            "pipeline": [{"$group": {"_id": None, "total": {"$sum": "$count"}}}],
+            "as": "sales",
+        }},
+        {"$addFields": {
+            "books_published": {"$size": "$books"},
+            "review_count": {"$ifNull": [{"$first": "$reviews.n"}, 0]},
+            "score_sum": {"$ifNull": [{"$first": "$reviews.total"}, 0]},
+            "total_sales": {"$ifNull": [{"$first": "$sales.total"}, 0]},
+        }},
+        {"$addFields": {"avg_score": avg_score_expr()}},
+        {"$project": {"books": 0, "reviews": 0, "sales": 0}},
+    ]
+
+
+def avg_score_expr():
+    return {"$cond": [
+        {"$gt": ["$review_count", 0]},
+        {"$round": [{"$divide": ["$score_sum", "$review_count"]}, 2]},
+        0.0,
+    ]}
+
+
+def rebuild_book_stats():
+    Book._get_collection().update_many({}, {"$set": BOOK_STATS_ZERO})
+    Review._get_collection().aggregate([
+        {"$group": {"_id": "$book", "review_count": {"$sum": 1}, "score_sum": {"$sum": "$score"}}},
+        {"$merge": {"into": Book._get_collection_name(), "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ])
+    Sale._get_collection().aggregate([
+        {"$group": {
+            "_id": "$book",
+            "total_sales": {"$sum": "$count"},
+            "years": {"$push": {"k": {"$toString": "$year"}, "v": "$count"}},
+        }},
+        {"$project": {"total_sales": 1, "sales_by_year": {"$arrayToObject": "$years"}}},
+        {"$merge": {"into": Book._get_collection_name(), "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ])
+
+
+def rebuild_author_stats():
+    Author._get_collection().aggregate(author_stats_stages() + [
+        {"$project": {field: 1 for field in AUTHOR_STATS_ZERO}},
+        {"$merge": {"into": Author._get_collection_name(), "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ])
+
+
+def rebuild_all():
+    rebuild_book_stats()
+    rebuild_author_stats()
+    refresh_year_top_sales()
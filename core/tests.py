@@ -1,3 +1,283 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import bson
+import mongoengine
+import mongomock
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import cache as cache_module
+from core.bulk import bulk_add_sales, bulk_create_reviews, write_items
+from core.cache import LocalLRU, acache_get_or_set, bump_versions, cache_get_or_set
+from core.models import Author, Book, Review, Sale, YearTopSales
+from sa_library.db import ANALYTICS_ALIAS, connect_db
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class MongoTestCase(SimpleTestCase):
+    # models on an in-memory mongomock database, emptied before every test
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for alias in (mongoengine.DEFAULT_CONNECTION_NAME, ANALYTICS_ALIAS):
+            mongoengine.disconnect(alias)
+            mongoengine.connect("test", alias=alias, mongo_client_class=mongomock.MongoClient)
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in (mongoengine.DEFAULT_CONNECTION_NAME, ANALYTICS_ALIAS):
+            mongoengine.disconnect(alias)
+        connect_db()
+        super().tearDownClass()
+
+    def setUp(self):
+        db = mongoengine.get_db()
+        for name in db.list_collection_names():
+            db.drop_collection(name)
+
+
+@override_settings(CACHES=LOCMEM)
+class CacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patches = [
+            mock.patch.object(cache_module, "CACHE_ENABLED", True),
+            mock.patch.object(cache_module, "_l1", LocalLRU(1024 * 1024, 5)),
+            mock.patch.object(cache_module, "_l1_versions", LocalLRU(1024, 5)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_computes_once_then_hits(self):
+        calls = []
+        compute = lambda: calls.append(1) or {"rows": [1, 2]}
+        self.assertEqual(cache_get_or_set("k", compute), {"rows": [1, 2]})
+        self.assertEqual(cache_get_or_set("k", compute), {"rows": [1, 2]})
+        self.assertEqual(len(calls), 1)
+
+    def test_hits_return_copies(self):
+        cache_get_or_set("k", lambda: {"rows": [1]})
+        cache_get_or_set("k", lambda: None)["rows"].append(2)
+        self.assertEqual(cache_get_or_set("k", lambda: None), {"rows": [1]})
+
+    def test_stale_hit_triggers_one_refresh(self):
+        cache_get_or_set("k", lambda: "old", timeout=0.01)
+        time.sleep(0.05)
+
+        calls = []
+        release = threading.Event()
+
+        def refresh():
+            calls.append(1)
+            release.wait(5)
+            return "new"
+
+        # stale entries are served while a single background refresh runs
+        for _ in range(5):
+            self.assertEqual(cache_get_or_set("k", refresh, timeout=0.01), "old")
+        release.set()
+
+        deadline = time.time() + 5
+        while cache_get_or_set("k", refresh, timeout=60) != "new" and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cache_get_or_set("k", refresh, timeout=60), "new")
+        self.assertEqual(len(calls), 1)
+
+    def test_bump_retires_dependent_keys(self):
+        self.assertEqual(cache_get_or_set("k", lambda: 1, depends_on=("book",)), 1)
+        bump_versions("sale")
+        self.assertEqual(cache_get_or_set("k", lambda: 2, depends_on=("book",)), 1)
+        bump_versions("book")
+        self.assertEqual(cache_get_or_set("k", lambda: 3, depends_on=("book",)), 3)
+
+    def test_stats_endpoint_reports_hits(self):
+        cache_get_or_set("k", lambda: 1)
+        cache_get_or_set("k", lambda: 1)
+        with mock.patch.dict(cache_module._stats, {k: 0 for k in cache_module._stats}):
+            cache_get_or_set("k", lambda: 1)
+            stats = self.client.get("/api/cache/stats/").json()
+        self.assertEqual(stats["l1_hits"], 1)
+        self.assertEqual(stats["l1_entries"], 1)
+
+    def test_async_computes_once(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return [1]
+
+        async def run():
+            return [await acache_get_or_set("k", compute), await acache_get_or_set("k", compute)]
+
+        self.assertEqual(asyncio.run(run()), [[1], [1]])
+        self.assertEqual(len(calls), 1)
+
+
+class LocalLRUTests(SimpleTestCase):
+    def test_eviction_stays_under_budget(self):
+        lru = LocalLRU(100, 60)
+        for i in range(10):
+            lru.set(i, i, 30)
+            lru.get(0)  # recently used: survives eviction
+            self.assertLessEqual(lru.size, 100)
+        self.assertEqual(lru.get(0), 0)
+        self.assertEqual(lru.get(9), 9)
+        self.assertIsNone(lru.get(1))
+        self.assertEqual(len(lru), 3)
+
+    def test_oversized_items_are_not_stored(self):
+        lru = LocalLRU(100, 60)
+        lru.set("big", "x", 101)
+        self.assertIsNone(lru.get("big"))
+        self.assertEqual(lru.size, 0)
+
+    def test_expired_items_are_dropped(self):
+        lru = LocalLRU(100, 0)
+        lru.set("k", "v", 10)
+        self.assertIsNone(lru.get("k"))
+        self.assertEqual(lru.size, 0)
+
+
+class BulkWriteTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = Author(name="Author").save()
+        self.book = Book(author=self.author, name="Book").save()
+
+    def test_rejected_sales_are_not_written(self):
+        book = str(self.book.id)
+        written, errors = bulk_add_sales([
+            {"book": book, "year": 2020, "count": -5},
+            {"book": book, "year": 2021, "count": 2},
+            {"book": "nope", "year": 2022, "count": 1},
+            {"book": book, "year": 2021, "count": 3},
+        ])
+        self.assertEqual(written, 2)
+        self.assertEqual(errors, [
+            {"index": 0, "error": "count out of range"},
+            {"index": 2, "error": "Invalid book id"},
+        ])
+        self.assertEqual([(s.year, s.count) for s in Sale.objects], [(2021, 5)])
+        self.assertEqual(Book.objects.get(id=self.book.id).total_sales, 5)
+
+    def test_rejected_reviews_are_not_written(self):
+        book = str(self.book.id)
+        written, errors = bulk_create_reviews([
+            {"book": book, "score": 4},
+            {"book": book, "score": 9},
+            {"book": book, "score": 2, "up_votes": "x"},
+        ], start=10)
+        self.assertEqual(written, 1)
+        self.assertEqual([e["index"] for e in errors], [11, 12])
+        self.assertEqual([r.score for r in Review.objects], [4])
+        self.assertEqual(Author.objects.get(id=self.author.id).review_count, 1)
+
+    def test_ndjson_bad_lines_are_reported(self):
+        book = str(self.book.id)
+        lines = [
+            json.dumps({"book": book, "year": 2020, "count": 1}),
+            "{not json",
+            "",
+            "[1, 2]",
+            json.dumps({"book": book, "year": 2020, "count": 2}),
+        ]
+        request = RequestFactory().post("/", "\n".join(lines), content_type="application/x-ndjson")
+        written, errors = write_items(request, bulk_add_sales)
+        self.assertEqual(written, 2)
+        self.assertEqual([e["index"] for e in errors], [1, 2])
+        self.assertEqual(Sale.objects.get(year=2020).count, 3)
+
+
+class StatsTests(MongoTestCase):
+    # the denormalized counters follow the API writes without a rebuild
+    def setUp(self):
+        super().setUp()
+        self.author = Author(name="Author").save()
+        self.other = Author(name="Other").save()
+        self.book = self.post("/api/books/new/", {"author": str(self.author.id), "name": "Book"})["id"]
+
+    def post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type="application/json").json()
+
+    def put(self, path, data):
+        response = self.client.put(path, json.dumps(data), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+    def assertCounters(self, model, doc_id, **expected):
+        doc = model._get_collection().find_one({"_id": bson.ObjectId(str(doc_id))})
+        self.assertEqual({k: doc.get(k) for k in expected}, expected)
+
+    def top(self):
+        return {t.year: [str(b) for b in t.books] for t in YearTopSales.objects}
+
+    def test_review_edit_and_delete(self):
+        first = self.post("/api/reviews/new/", {"book": self.book, "score": 4})["id"]
+        second = self.post("/api/reviews/new/", {"book": self.book, "score": 2})["id"]
+        self.assertCounters(Book, self.book, review_count=2, score_sum=6)
+
+        self.put(f"/api/reviews/{second}/edit/", {"score": 5})
+        self.assertCounters(Book, self.book, review_count=2, score_sum=9)
+        self.assertCounters(Author, self.author.id, review_count=2, score_sum=9)
+
+        other_book = self.post("/api/books/new/", {"author": str(self.other.id), "name": "Other book"})["id"]
+        self.put(f"/api/reviews/{first}/edit/", {"book": other_book})
+        self.assertCounters(Book, self.book, review_count=1, score_sum=5)
+        self.assertCounters(Author, self.author.id, review_count=1, score_sum=5)
+        self.assertCounters(Author, self.other.id, review_count=1, score_sum=4)
+
+        self.client.delete(f"/api/reviews/{second}/delete/")
+        self.assertCounters(Book, self.book, review_count=0, score_sum=0)
+        self.assertCounters(Author, self.author.id, review_count=0, score_sum=0)
+
+    def test_sale_moves_between_years(self):
+        sale = self.post("/api/sales/new/", {"book": self.book, "year": 2020, "count": 7})["id"]
+        self.assertCounters(Book, self.book, total_sales=7, sales_by_year={"2020": 7})
+        self.assertEqual(self.top(), {2020: [self.book]})
+
+        self.put(f"/api/sales/{sale}/edit/", {"year": 2021, "count": 3})
+        self.assertCounters(Book, self.book, total_sales=3, sales_by_year={"2020": 0, "2021": 3})
+        self.assertCounters(Author, self.author.id, total_sales=3)
+        self.assertEqual(self.top(), {2021: [self.book]})
+
+        self.client.delete(f"/api/sales/{sale}/delete/")
+        self.assertCounters(Author, self.author.id, total_sales=0)
+        self.assertEqual(self.top(), {})
+
+    def test_book_author_change_moves_its_stats(self):
+        self.post("/api/reviews/new/", {"book": self.book, "score": 3})
+        self.post("/api/sales/new/", {"book": self.book, "year": 2020, "count": 10})
+
+        self.put(f"/api/books/{self.book}/edit/", {"author": str(self.other.id)})
+        self.assertCounters(Author, self.author.id, books_published=0, review_count=0, score_sum=0, total_sales=0)
+        self.assertCounters(Author, self.other.id, books_published=1, review_count=1, score_sum=3, total_sales=10)
+
+    def test_book_delete_cascades(self):
+        kept = self.post("/api/books/new/", {"author": str(self.author.id), "name": "Kept"})["id"]
+        self.post("/api/reviews/new/", {"book": self.book, "score": 5})
+        self.post("/api/reviews/new/", {"book": kept, "score": 1})
+        self.post("/api/sales/new/", {"book": self.book, "year": 2020, "count": 10})
+        self.post("/api/sales/new/", {"book": kept, "year": 2020, "count": 4})
+
+        self.client.delete(f"/api/books/{self.book}/delete/")
+        self.assertEqual(Review.objects.count(), 1)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertCounters(Author, self.author.id, books_published=1, review_count=1, score_sum=1, total_sales=4)
+        self.assertEqual(self.top(), {2020: [kept]})
+
+    def test_author_delete_cascades(self):
+        other_book = self.post("/api/books/new/", {"author": str(self.other.id), "name": "Other book"})["id"]
+        self.post("/api/reviews/new/", {"book": self.book, "score": 5})
+        self.post("/api/sales/new/", {"book": self.book, "year": 2020, "count": 10})
+        self.post("/api/sales/new/", {"book": other_book, "year": 2021, "count": 4})
+
+        self.client.delete(f"/api/authors/{self.author.id}/delete/")
+        self.assertEqual([str(b.id) for b in Book.objects], [other_book])
+        self.assertEqual(Review.objects.count(), 0)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(self.top(), {2021: [other_book]})
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.urls import path
 from core.views import (
+    cache_stats_view,
     author_list,
     author_create,
     author_edit,
@@ -12,20 +14,37 @@ from core.views import (
     book_detail,
     review_list,
     review_create,
+    review_bulk,
     review_edit,
     review_delete,
     review_detail,
     sale_list,
     sale_create,
+    sale_bulk,
     sale_edit,
     sale_delete,
     sale_detail,
+    review_export,
+    sale_export,
     search_books_view,
     search_authors_view,
     search_reviews_view,
     search_sales_view,
 )
 
+if getattr(settings, "ASYNC_VIEWS", False):
+    # Motor-backed read views, for ASGI servers
+    from core.views.async_views import (
+        author_list_async as author_list,
+        author_detail_async as author_detail,
+        book_list_async as book_list,
+        book_detail_async as book_detail,
+        review_list_async as review_list,
+        review_detail_async as review_detail,
+        sale_list_async as sale_list,
+        sale_detail_async as sale_detail,
+    )
+
 urlpatterns = [
     path("authors/", author_list, name="author_list"),
     path("authors/new/", author_create, name="author_create"),
@@ -39,11 +58,15 @@ urlpatterns = [
     path("books/<book_id>/delete/", book_delete, name="book_delete"),
     path("reviews/", review_list, name="review_list"),
     path("reviews/new/", review_create, name="review_create"),
+    path("reviews/bulk/", review_bulk, name="review_bulk"),
+    path("reviews/export/", review_export, name="review_export"),
     path("reviews/<review_id>/", review_detail, name="review_detail"),
     path("reviews/<review_id>/edit/", review_edit, name="review_edit"),
     path("reviews/<review_id>/delete/", review_delete, name="review_delete"),
     path("sales/", sale_list, name="sale_list"),
     path("sales/new/", sale_create, name="sale_create"),
+    path("sales/bulk/", sale_bulk, name="sale_bulk"),
+    path("sales/export/", sale_export, name="sale_export"),
     path("sales/<sale_id>/", sale_detail, name="sale_detail"),
     path("sales/<sale_id>/edit/", sale_edit, name="sale_edit"),
     path("sales/<sale_id>/delete/", sale_delete, name="sale_delete"),
@@ -51,4 +74,5 @@ urlpatterns = [
     path("search/authors/", search_authors_view, name="search_authors"),
     path("search/reviews/", search_reviews_view, name="search_reviews"),
     path("search/sales/", search_sales_view, name="search_sales"),
+    path("cache/stats/", cache_stats_view, name="cache_stats"),
 ]
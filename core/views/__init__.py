@@ -17,6 +17,7 @@ from .book_views import (
 from .review_views import (
     review_list,
     review_create,
+    review_bulk,
     review_edit,
     review_delete,
     review_detail,
@@ -25,11 +26,19 @@ from .review_views import (
 from .sale_views import (
     sale_list,
     sale_create,
+    sale_bulk,
     sale_edit,
     sale_delete,
     sale_detail,
 )
 
+from .export_views import (
+    review_export,
+    sale_export,
+)
+
+from .cache_views import cache_stats_view
+
 from .elastic_views import (
     search_books_view,
     search_authors_view,
@@ -0,0 +1,76 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotFound
+from django.views.decorators.http import require_GET
+
+from core import aio
+from core.models import Author, Book, Review, Sale
+from core.pagination import api_row, keyset_query, projection
+from core.views.author_views import AUTHOR_FIELDS
+from core.views.book_views import BOOK_FIELDS
+from core.views.review_views import REVIEW_FIELDS
+from core.views.sale_views import SALE_FIELDS
+
+# Async (Motor) versions of the API read views, routed instead of the sync ones when
+# ASYNC_VIEWS is on. Responses are the same as the sync views.
+
+
+async def _list(request, model, fields, plural):
+    try:
+        query, wanted, limit = keyset_query(model, request.GET, fields)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    cursor = aio.collection(model).find(query, projection(wanted)).sort("_id", 1).limit(limit)
+    data = [api_row(model, doc, wanted) for doc in await cursor.to_list(limit)]
+    next_after = data[-1]["id"] if len(data) == limit else None
+    return JsonResponse({plural: data, "next": next_after})
+
+
+async def _detail(model, fields, object_id):
+    try:
+        doc = await aio.collection(model).find_one({"_id": ObjectId(object_id)}, projection(fields))
+    except (InvalidId, TypeError):
+        doc = None
+    if doc is None:
+        return HttpResponseNotFound(f"{model.__name__} not found")
+    return JsonResponse(api_row(model, doc, fields))
+
+
+@require_GET
+async def author_list_async(request):
+    return await _list(request, Author, AUTHOR_FIELDS, "authors")
+
+
+@require_GET
+async def author_detail_async(request, author_id):
+    return await _detail(Author, AUTHOR_FIELDS, author_id)
+
+
+@require_GET
+async def book_list_async(request):
+    return await _list(request, Book, BOOK_FIELDS, "books")
+
+
+@require_GET
+async def book_detail_async(request, book_id):
+    return await _detail(Book, BOOK_FIELDS, book_id)
+
+
+@require_GET
+async def review_list_async(request):
+    return await _list(request, Review, REVIEW_FIELDS, "reviews")
+
+
+@require_GET
+async def review_detail_async(request, review_id):
+    return await _detail(Review, REVIEW_FIELDS, review_id)
+
+
+@require_GET
+async def sale_list_async(request):
+    return await _list(request, Sale, SALE_FIELDS, "sales")
+
+
+@require_GET
+async def sale_detail_async(request, sale_id):
+    return await _detail(Sale, SALE_FIELDS, sale_id)
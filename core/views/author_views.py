@@ -2,23 +2,19 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotFound
 from django.views.decorators.http import require_http_methods
 from core.models import Author
+from core.pagination import keyset_page
+
+AUTHOR_FIELDS = ("name", "birthday", "origin_country", "description")
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def author_list(request):
-    authors = Author.objects.all()
-    data = [
-        {
-            "id": str(author.id),
-            "name": author.name,
-            "birthday": author.birthday,
-            "origin_country": author.origin_country,
-            "description": author.description,
-        }
-        for author in authors
-    ]
-    return JsonResponse({"authors": data})
+    try:
+        data, next_after = keyset_page(Author, request.GET, AUTHOR_FIELDS)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse({"authors": data, "next": next_after})
 
 
 @csrf_exempt
@@ -2,23 +2,20 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotFound
 from django.views.decorators.http import require_http_methods
 from core.models import Book, Author
+from core.pagination import keyset_page
+from core import stats
+
+BOOK_FIELDS = ("author", "name", "summary", "publication_date")
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def book_list(request):
-    books = Book.objects.all()
-    data = [
-        {
-            "id": str(book.id),
-            "author": str(book.author.id) if book.author else None,
-            "name": book.name,
-            "summary": book.summary,
-            "publication_date": book.publication_date,
-        }
-        for book in books
-    ]
-    return JsonResponse({"books": data})
+    try:
+        data, next_after = keyset_page(Book, request.GET, BOOK_FIELDS)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse({"books": data, "next": next_after})
 
 
 @csrf_exempt
@@ -37,6 +34,7 @@ def book_create(request):
 
     book = Book(author=author, name=name, summary=summary, publication_date=publication_date)
     book.save()
+    stats.book_changed(book, author.id)
     return JsonResponse({
         "id": str(book.id),
         "author": str(book.author.id),
@@ -55,6 +53,7 @@ def book_edit(request, book_id):
     except Book.DoesNotExist:
         return HttpResponseNotFound("Book not found")
     try:
+        old_author_id = stats.ref_id(book, "author")
         data = json.loads(request.body)
         if "author" in data:
             book.author = Author.objects.get(id=data["author"])
@@ -62,6 +61,9 @@ def book_edit(request, book_id):
         book.summary = data.get("summary", book.summary)
         book.publication_date = data.get("publication_date", book.publication_date)
         book.save()
+        if old_author_id != stats.ref_id(book, "author"):
+            stats.book_changed(book, old_author_id, -1)
+            stats.book_changed(book, stats.ref_id(book, "author"))
     except Exception:
         return HttpResponseBadRequest("Invalid JSON or Author not found")
     return JsonResponse({
@@ -81,6 +83,7 @@ def book_delete(request, book_id):
     except Book.DoesNotExist:
         return HttpResponseNotFound("Book not found")
     book.delete()
+    stats.book_removed(book)
     return JsonResponse({"result": "deleted"})
 
 
@@ -0,0 +1,12 @@
+import os
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from core.cache import cache_stats
+
+
+@require_GET
+def cache_stats_view(request):
+    # hit/miss counters of the worker process that served the request (each has its own L1)
+    return JsonResponse({"pid": os.getpid(), **cache_stats()})
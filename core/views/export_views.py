@@ -0,0 +1,97 @@
+import csv
+import io
+
+import orjson
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from core.models import Review, Sale
+
+EXPORT_BATCH_SIZE = 2000
+REVIEW_EXPORT_FIELDS = ("book", "score", "up_votes")
+SALE_EXPORT_FIELDS = ("book", "count", "year")
+
+
+def _export_query(params, with_year=False):
+    query = {}
+    if params.get("book"):
+        query["book"] = ObjectId(params["book"])
+    if params.get("after"):
+        # resume after the last id a previous export delivered
+        query["_id"] = {"$gt": ObjectId(params["after"])}
+    if with_year:
+        years = {}
+        if params.get("year_from"):
+            years["$gte"] = int(params["year_from"])
+        if params.get("year_to"):
+            years["$lte"] = int(params["year_to"])
+        if years:
+            query["year"] = years
+    return query
+
+
+def _rows(model, query, fields):
+    cursor = (
+        model._get_collection()
+        .find(query, {f: 1 for f in fields})
+        .sort("_id", 1)
+        .batch_size(EXPORT_BATCH_SIZE)
+    )
+    for doc in cursor:
+        yield [str(doc["_id"])] + [
+            str(doc[f]) if isinstance(doc.get(f), ObjectId) else doc.get(f) for f in fields
+        ]
+
+
+def _ndjson(rows, fields):
+    keys = ("id",) + fields
+    chunk = []
+    for row in rows:
+        chunk.append(orjson.dumps(dict(zip(keys, row))))
+        if len(chunk) >= EXPORT_BATCH_SIZE:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+
+def _csv(rows, fields):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(("id",) + fields)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    yield buf.getvalue()
+
+
+def _export(request, model, fields, name, with_year=False):
+    fmt = request.GET.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return HttpResponseBadRequest("format must be ndjson or csv")
+    try:
+        query = _export_query(request.GET, with_year)
+    except (ValueError, InvalidId):
+        return HttpResponseBadRequest("Invalid book, after or year filter")
+
+    rows = _rows(model, query, fields)
+    if fmt == "csv":
+        response = StreamingHttpResponse(_csv(rows, fields), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="{name}.csv"'
+    else:
+        response = StreamingHttpResponse(_ndjson(rows, fields), content_type="application/x-ndjson")
+    return response
+
+
+@require_GET
+def review_export(request):
+    return _export(request, Review, REVIEW_EXPORT_FIELDS, "reviews")
+
+
+@require_GET
+def sale_export(request):
+    return _export(request, Sale, SALE_EXPORT_FIELDS, "sales", with_year=True)
@@ -2,22 +2,21 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotFound
 from django.views.decorators.http import require_http_methods
 from core.models import Review, Book
+from core.pagination import keyset_page
+from core.bulk import write_items, bulk_create_reviews
+from core import stats
+
+REVIEW_FIELDS = ("book", "score", "up_votes")
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def review_list(request):
-    reviews = Review.objects.all()
-    data = [
-        {
-            "id": str(review.id),
-            "book": str(review.book.id) if review.book else None,
-            "score": review.score,
-            "up_votes": review.up_votes,
-        }
-        for review in reviews
-    ]
-    return JsonResponse({"reviews": data})
+    try:
+        data, next_after = keyset_page(Review, request.GET, REVIEW_FIELDS)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse({"reviews": data, "next": next_after})
 
 
 @csrf_exempt
@@ -35,6 +34,7 @@ def review_create(request):
 
     review = Review(book=book, score=score, up_votes=up_votes)
     review.save()
+    stats.review_changed(book, review.score)
     return JsonResponse({
         "id": str(review.id),
         "book": str(review.book.id),
@@ -43,6 +43,16 @@ def review_create(request):
     }, status=201)
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def review_bulk(request):
+    try:
+        written, errors = write_items(request, bulk_create_reviews)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse({"written": written, "errors": errors})
+
+
 @csrf_exempt
 @require_http_methods(["PUT"])
 def review_edit(request, review_id):
@@ -52,6 +62,7 @@ def review_edit(request, review_id):
     except Review.DoesNotExist:
         return HttpResponseNotFound("Review not found")
     try:
+        old_book, old_score = review.book, review.score
         data = json.loads(request.body)
         if "book" in data:
             review.book = Book.objects.get(id=data["book"])
@@ -60,6 +71,9 @@ def review_edit(request, review_id):
         if "up_votes" in data:
             review.up_votes = data["up_votes"]
         review.save()
+        if old_book != review.book or old_score != review.score:
+            stats.review_changed(old_book, old_score, -1)
+            stats.review_changed(review.book, review.score)
     except Exception:
         return HttpResponseBadRequest("Invalid JSON or Book not found")
     return JsonResponse({
@@ -78,6 +92,7 @@ def review_delete(request, review_id):
     except Review.DoesNotExist:
         return HttpResponseNotFound("Review not found")
     review.delete()
+    stats.review_changed(review.book, review.score, -1)
     return JsonResponse({"result": "deleted"})
 
 
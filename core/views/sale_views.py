@@ -1,22 +1,22 @@
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotFound
 from django.views.decorators.http import require_http_methods
+from bson import ObjectId
 from core.models import Sale, Book
+from core.pagination import keyset_page
+from core.bulk import SALES_BUFFER_ENABLED, add_sales, bulk_add_sales, sales_buffer, write_items
+from core import stats
+
+SALE_FIELDS = ("book", "count", "year")
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def sale_list(request):
-    sales = Sale.objects.all()
-    data = [
-        {
-            "id": str(sale.id),
-            "book": str(sale.book.id) if sale.book else None,
-            "count": sale.count,
-            "year": sale.year,
-        }
-        for sale in sales
-    ]
-    return JsonResponse({"sales": data})
+    try:
+        data, next_after = keyset_page(Sale, request.GET, SALE_FIELDS)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse({"sales": data, "next": next_after})
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -25,21 +25,42 @@ def sale_create(request):
     try:
         data = json.loads(request.body)
         book_id = data.get("book")
-        count = data.get("count")
-        year = data.get("year")
-        book = Book.objects.get(id=book_id)
+        count = int(data.get("count"))
+        year = int(data.get("year"))
     except Exception:
-        return HttpResponseBadRequest("Invalid JSON or Book not found")
+        return HttpResponseBadRequest("Invalid JSON")
+    if count < 0:
+        return HttpResponseBadRequest("count must not be negative")
 
-    sale = Sale(book=book, count=count, year=year)
-    sale.save()
+    if SALES_BUFFER_ENABLED:
+        # validated against the books collection when the buffer is flushed
+        if not ObjectId.is_valid(book_id):
+            return HttpResponseBadRequest("Invalid book id")
+        sales_buffer.add(book_id, year, count)
+        return JsonResponse({"book": book_id, "count": count, "year": year, "queued": True}, status=202)
+
+    try:
+        book = Book.objects.get(id=book_id)
+    except Exception:
+        return HttpResponseBadRequest("Book not found")
+    # adds to the (book, year) row, creating it if needed
+    sale = add_sales(book, year, count)
     return JsonResponse({
-        "id": str(sale.id),
-        "book": str(sale.book.id),
-        "count": sale.count,
-        "year": sale.year,
+        "id": str(sale["_id"]),
+        "book": str(book.id),
+        "count": sale["count"],
+        "year": sale["year"],
     }, status=201)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def sale_bulk(request):
+    try:
+        written, errors = write_items(request, bulk_add_sales)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse({"written": written, "errors": errors})
+
 @csrf_exempt
 @require_http_methods(["PUT"])
 def sale_edit(request, sale_id):
@@ -49,6 +70,7 @@ def sale_edit(request, sale_id):
     except Sale.DoesNotExist:
         return HttpResponseNotFound("Sale not found")
     try:
+        old_book, old_year, old_count = sale.book, sale.year, sale.count
         data = json.loads(request.body)
         if "book" in data:
             sale.book = Book.objects.get(id=data["book"])
@@ -57,6 +79,8 @@ def sale_edit(request, sale_id):
         if "year" in data:
             sale.year = data["year"]
         sale.save()
+        stats.sales_changed(old_book, old_year, -old_count)
+        stats.sales_changed(sale.book, sale.year, sale.count)
     except Exception:
         return HttpResponseBadRequest("Invalid JSON or Book not found")
     return JsonResponse({
@@ -74,6 +98,7 @@ def sale_delete(request, sale_id):
     except Sale.DoesNotExist:
         return HttpResponseNotFound("Sale not found")
     sale.delete()
+    stats.sales_changed(sale.book, sale.year, -sale.count)
     return JsonResponse({"result": "deleted"})
 
 @csrf_exempt
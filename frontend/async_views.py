@@ -0,0 +1,31 @@
+from django.core.paginator import Paginator
+from django.shortcuts import render
+
+from core import async_services
+from frontend.views import ES_ENABLED
+
+
+# Versiones async (Motor / AsyncElasticsearch) de las vistas de solo lectura, ver ASYNC_VIEWS
+
+async def top_rated(request):
+    ctx = {"items": await async_services.get_top_rated_books()}
+    return render(request, "tables/topRated.html", ctx)
+
+
+async def top_selling(request):
+    ctx = {"items": await async_services.get_top_selling_books()}
+    return render(request, "tables/topSelling.html", ctx)
+
+
+async def search_books(request):
+    q = (request.GET.get("q") or "").strip()
+
+    if q and ES_ENABLED:
+        results = await async_services.search_books_es(q)
+    else:
+        results = await async_services.search_books_by_summary(q)
+
+    paginator = Paginator(results, 20)
+    page_obj = paginator.get_page(request.GET.get("page"))
+
+    return render(request, "search.html", {"q": q, "page_obj": page_obj})
@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+read_views = views
+if getattr(settings, "ASYNC_VIEWS", False):
+    from . import async_views as read_views
+
 urlpatterns = [
     path("", views.home, name="home"),
     path("authors/", views.authors_table, name="authors_table"),
@@ -17,7 +22,7 @@ urlpatterns = [
     path("books/<book_id>/reviews/new/", views.review_create, name="review_create"),
     path("books/<book_id>/sales/", views.book_sales, name="book_sales"),
     path("books/<book_id>/sales/new/", views.sale_create, name="sale_create"),
-    path("top-rated/", views.top_rated, name="top_rated"),
-    path("top-selling/", views.top_selling, name="top_selling"),
-    path("search/", views.search_books, name="search_books"),
+    path("top-rated/", read_views.top_rated, name="top_rated"),
+    path("top-selling/", read_views.top_selling, name="top_selling"),
+    path("search/", read_views.search_books, name="search_books"),
 ]
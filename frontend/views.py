@@ -1,4 +1,5 @@
 
+import logging
 import os, uuid
 from django.core.files.storage import default_storage
 from django.utils.text import get_valid_filename
@@ -9,12 +10,18 @@ from django.contrib import messages
 from core.services import (
     get_top_rated_books,
     get_authors_table,
+    count_authors,
     get_top_selling_books,
     search_books_by_summary,
 )
-from core.models import Author, Book, Review, Sale
+from core.models import Author, Book, Review
+from core.pagination import MongoPaginator, PagedRows, page_number, prefetched_page
+from core.dashboard import get_book_dashboard, review_stats, sale_stats
+from core.bulk import add_sales
+from core import stats
 from core.search import search_books as es_search_books
-from core.search import search_authors as es_search_authors
+from core.search import search_authors_table as es_search_authors_table
+from core.search import count_authors_table as es_count_authors_table
 from urllib.parse import urlencode
 from datetime import datetime
 from dotenv import load_dotenv
@@ -23,6 +30,7 @@ import os
 load_dotenv()
 ES_ENABLED = os.getenv("ES_ENABLED", "false").lower() == "true"
 print("ES_ENABLED", ES_ENABLED)
+logger = logging.getLogger(__name__)
 
 
 
@@ -50,13 +58,19 @@ def authors_table(request):
     if not (filters["name"] or filters["country"]) or not ES_ENABLED:
         # fallback to Mongo service with sorting
         print("Using Mongo service for authors table")
-        data = get_authors_table(filters, sort, order)
+        data = PagedRows(
+            lambda skip, limit: get_authors_table(filters, sort, order, skip, limit),
+            lambda: count_authors(filters),
+        )
     else:
-        # ES search (you could add sorting here later with ES `sort=...`)
-        query = f"{filters['name']} {filters['country']}".strip()
-        data = es_search_authors(query, sort, order)
-
-    paginator = Paginator(list(data), 20)
+        # ES search: filtered, sorted and paginated in ES (the stats are indexed with the author)
+        logger.debug("Using ES for authors table")
+        data = PagedRows(
+            lambda skip, limit: es_search_authors_table(filters, sort, order, skip, limit),
+            lambda: es_count_authors_table(filters),
+        )
+
+    paginator = MongoPaginator(data, 20)
     page_obj = paginator.get_page(request.GET.get("page"))
 
     # preserve query params for links
@@ -162,6 +176,13 @@ def author_delete(request, author_id):
 
 
 # CRUD DE LIBROS
+BOOK_SORT_FIELDS = {
+    "name": "name",
+    "author": "author",
+    "date": "publication_date",
+}
+
+
 def books_table(request):
     filters = {
         "name": (request.GET.get("name") or "").strip(),
@@ -173,13 +194,18 @@ def books_table(request):
     if not (filters["name"] or filters["author"]) or not ES_ENABLED:
         # fallback to Mongo service with sorting
         print("Using Mongo service for books table")
-        data = Book.objects.all().order_by(f"{'' if order == 'asc' else '-'}{sort}")
+        prefix = "" if order == "asc" else "-"
+        sort_field = BOOK_SORT_FIELDS.get(sort, "name")
+        data = (
+            Book.objects.only("name", "author", "publication_date", "summary")
+            .order_by(f"{prefix}{sort_field}", f"{prefix}id")
+        )
     else:
         # ES search (you could add sorting here later with ES `sort=...`)
         query = f"{filters['name']} {filters['author']}".strip()
-        data = es_search_books(query, sort, order)
+        data = list(es_search_books(query, sort, order))
 
-    paginator = Paginator(list(data), 20)
+    paginator = MongoPaginator(data, 20)
     page_obj = paginator.get_page(request.GET.get("page"))
 
     # preserve query params for links
@@ -220,6 +246,7 @@ def book_create(request):
                 book.cover_image = _save_upload_and_get_relpath(cover_file, "books")
         
             book.save()
+            stats.book_changed(book, stats.ref_id(book, "author"))
             messages.success(request, f"Libro '{book.name}' creado exitosamente.")
             return redirect("books_table")
         except Exception as e:
@@ -230,23 +257,20 @@ def book_create(request):
 
 def book_detail(request, book_id):
     try:
-        book = Book.objects.get(id=book_id)
+        dashboard = get_book_dashboard(book_id, reviews=(0, 0), sales=(0, None))
     except Book.DoesNotExist:
         messages.error(request, "Libro no encontrado.")
         return redirect("books_table")
 
-    # Calcular estadísticas de ventas
-    sales = Sale.objects(book=book)
-    total_sales = sum(s.count for s in sales)
-    sales_by_year = {}
-    for s in sales:
-        sales_by_year[s.year] = sales_by_year.get(s.year, 0) + s.count
-
+    # Estadísticas de ventas y reseñas (un $facet por colección, en paralelo)
+    sales = dashboard["sales"]
     ctx = {
-        "book": book,
-        "total_sales": total_sales,
-        "sales_count": sales.count(),
-        "sales_by_year": dict(sorted(sales_by_year.items(), reverse=True)),
+        "book": dashboard["book"],
+        "total_sales": sales["total"],
+        "sales_count": sales["years"],
+        "sales_by_year": {s["year"]: s["count"] for s in sales["page"]},
+        "total_reviews": dashboard["reviews"]["count"],
+        "avg_score": dashboard["reviews"]["avg_score"],
     }
     return render(request, "books/detail.html", ctx)
 
@@ -262,6 +286,7 @@ def book_edit(request, book_id):
 
     if request.method == "POST":
         try:
+            old_author_id = stats.ref_id(book, "author")
             book.name = request.POST.get("name", "").strip()
 
             author_id = request.POST.get("author", "").strip()
@@ -282,6 +307,9 @@ def book_edit(request, book_id):
                 book.cover_image = _save_upload_and_get_relpath(cover_file, "books")
 
             book.save()
+            if old_author_id != stats.ref_id(book, "author"):
+                stats.book_changed(book, old_author_id, -1)
+                stats.book_changed(book, stats.ref_id(book, "author"))
             messages.success(request, f"Libro '{book.name}' actualizado exitosamente.")
             return redirect("book_detail", book_id=book.id)
         except Exception as e:
@@ -301,6 +329,7 @@ def book_delete(request, book_id):
         try:
             book_name = book.name
             book.delete()
+            stats.book_removed(book)
             messages.success(request, f"Libro '{book_name}' eliminado exitosamente.")
             return redirect("books_table")
         except Exception as e:
@@ -311,31 +340,26 @@ def book_delete(request, book_id):
 
 # CRUD DE RESEÑAS
 def book_reviews(request, book_id):
+    number = page_number(request.GET.get("page"))
     try:
-        book = Book.objects.get(id=book_id)
+        # Página de reseñas (score y up_votes descendente) y estadísticas en un solo $facet
+        dashboard = get_book_dashboard(book_id, reviews=((number - 1) * 10, 10))
     except Book.DoesNotExist:
         messages.error(request, "Libro no encontrado.")
         return redirect("books_table")
 
-    # Obtener reseñas ordenadas por score descendente y luego por up_votes descendente
-    reviews = Review.objects(book=book).order_by("-score", "-up_votes")
-
-    # Calcular estadísticas
-    total_reviews = reviews.count()
-    avg_score = 0
-    if total_reviews > 0:
-        total_score = sum(r.score for r in reviews)
-        avg_score = round(total_score / total_reviews, 2)
-
-    # Paginación
-    paginator = Paginator(list(reviews), 10)
-    page_obj = paginator.get_page(request.GET.get("page"))
+    book = dashboard["book"]
+    reviews = dashboard["reviews"]
+    page_obj = prefetched_page(
+        reviews["page"], reviews["count"], number, 10,
+        lambda skip, limit: review_stats(book.id, skip, limit)["page"],
+    )
 
     ctx = {
         "book": book,
         "page_obj": page_obj,
-        "total_reviews": total_reviews,
-        "avg_score": avg_score,
+        "total_reviews": reviews["count"],
+        "avg_score": reviews["avg_score"],
     }
     return render(request, "reviews/book_reviews.html", ctx)
 
@@ -362,6 +386,7 @@ def review_create(request, book_id):
             review.up_votes = int(up_votes) if up_votes else 0
 
             review.save()
+            stats.review_changed(book, review.score)
             messages.success(
                 request, f"Reseña agregada exitosamente al libro '{book.name}'."
             )
@@ -376,24 +401,26 @@ def review_create(request, book_id):
 
 # CRUD DE VENTAS
 def book_sales(request, book_id):
+    number = page_number(request.GET.get("page"))
     try:
-        book = Book.objects.get(id=book_id)
+        # Página de ventas (año descendente) y totales en un solo $facet
+        dashboard = get_book_dashboard(book_id, sales=((number - 1) * 10, 10))
     except Book.DoesNotExist:
         messages.error(request, "Libro no encontrado.")
         return redirect("books_table")
 
-    # Obtener ventas ordenadas por año descendente
-    sales = Sale.objects(book=book).order_by("-year")
+    book = dashboard["book"]
+    sales = dashboard["sales"]
+    page_obj = prefetched_page(
+        sales["page"], sales["years"], number, 10,
+        lambda skip, limit: sale_stats(book.id, skip, limit)["page"],
+    )
 
     # Calcular estadísticas
-    total_sales = sum(s.count for s in sales)
-    sales_years = sales.count()
+    total_sales = sales["total"]
+    sales_years = sales["years"]
     avg_per_year = round(total_sales / sales_years, 1) if sales_years > 0 else 0
 
-    # Paginación
-    paginator = Paginator(list(sales), 10)
-    page_obj = paginator.get_page(request.GET.get("page"))
-
     ctx = {
         "book": book,
         "page_obj": page_obj,
@@ -427,23 +454,14 @@ def sale_create(request, book_id):
                 messages.error(request, "La cantidad debe ser mayor a 0.")
                 return render(request, "sales/create.html", {"book": book})
 
-            # Verificar si ya existe una venta para ese año
-            existing_sale = Sale.objects(book=book, year=year_int).first()
-            if existing_sale:
-                # Actualizar la venta existente
-                existing_sale.count += count_int
-                existing_sale.save()
+            # Suma a la venta de ese año (o la crea) en una sola operación atómica
+            sale = add_sales(book, year_int, count_int)
+            if sale["count"] > count_int:
                 messages.success(
                     request,
-                    f"Se agregaron {count_int} ventas al año {year_int}. Total: {existing_sale.count} ventas.",
+                    f"Se agregaron {count_int} ventas al año {year_int}. Total: {sale['count']} ventas.",
                 )
             else:
-                # Crear nueva venta
-                sale = Sale()
-                sale.book = book
-                sale.year = year_int
-                sale.count = count_int
-                sale.save()
                 messages.success(
                     request, f"Se agregaron {count_int} ventas para el año {year_int}."
                 )
@@ -466,15 +484,12 @@ def search_books(request):
 
     q = (request.GET.get("q") or "").strip()
 
-    results = []
-
-    # If elastic is disabled, always use Mongo service
-
-    if (q and not ES_ENABLED) or not q:
+    # If elastic is disabled, always use Mongo service (text index, regex fallback)
+    if q and ES_ENABLED:
+        results = es_search_books(q)  # returns list of dicts normalized for template
+    else:
         print("Using Mongo search")
         results = search_books_by_summary(q)
-    if q:
-        results = es_search_books(q)  # returns list of dicts normalized for template
 
     paginator = Paginator(results, 20)  # paginate ES results like before
     page_obj = paginator.get_page(request.GET.get("page"))
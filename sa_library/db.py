@@ -1,4 +1,9 @@
+import contextvars
+from contextlib import contextmanager
+
 import mongoengine
+from mongoengine.connection import get_db
+from pymongo import ReadPreference
 import dotenv
 import os
 
@@ -9,12 +14,81 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = int(os.getenv("DB_PORT", 27017))
 DB_USER = os.getenv("DB_USER", None)
 
+# Connection pool and driver options, see pymongo's MongoClient
+DB_MAX_POOL_SIZE = int(os.getenv("DB_MAX_POOL_SIZE", 100))
+DB_MIN_POOL_SIZE = int(os.getenv("DB_MIN_POOL_SIZE", 0))
+DB_MAX_IDLE_TIME_MS = os.getenv("DB_MAX_IDLE_TIME_MS")
+DB_WAIT_QUEUE_TIMEOUT_MS = os.getenv("DB_WAIT_QUEUE_TIMEOUT_MS")
+DB_COMPRESSORS = os.getenv("DB_COMPRESSORS", "")  # e.g. "zstd,snappy" (needs zstandard / python-snappy)
+DB_REPLICA_SET = os.getenv("DB_REPLICA_SET")
+DB_READ_PREFERENCE = os.getenv("DB_READ_PREFERENCE", "primary")
+
+# Heavy read-only aggregations (core.services) go through this alias so they can
+# be served by secondaries; writes always use the default alias on the primary.
+ANALYTICS_ALIAS = "analytics"
+DB_ANALYTICS_READ_PREFERENCE = os.getenv("DB_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def client_options():
+    # driver options shared by every client (mongoengine aliases and the async client)
+    options = {
+        "maxPoolSize": DB_MAX_POOL_SIZE,
+        "minPoolSize": DB_MIN_POOL_SIZE,
+    }
+    if DB_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = int(DB_MAX_IDLE_TIME_MS)
+    if DB_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = int(DB_WAIT_QUEUE_TIMEOUT_MS)
+    if DB_COMPRESSORS:
+        options["compressors"] = DB_COMPRESSORS
+    if DB_REPLICA_SET:
+        options["replicaSet"] = DB_REPLICA_SET
+    return options
+
 
 def connect_db():
-    mongoengine.connect(
-        db=DB_NAME,
-        host=DB_HOST,
-        port=DB_PORT,
-        username=DB_USER,
-    )
+    for alias, read_preference in (
+        (mongoengine.DEFAULT_CONNECTION_NAME, DB_READ_PREFERENCE),
+        (ANALYTICS_ALIAS, DB_ANALYTICS_READ_PREFERENCE),
+    ):
+        mongoengine.connect(
+            db=DB_NAME,
+            alias=alias,
+            host=DB_HOST,
+            port=DB_PORT,
+            username=DB_USER,
+            read_preference=READ_PREFERENCES[read_preference],
+            **client_options(),
+        )
+
+
+_primary_reads = contextvars.ContextVar("primary_reads", default=False)
+
+
+@contextmanager
+def primary_reads():
+    # Inside this block analytics reads go to the default alias (the primary). The cache
+    # uses it for the first computation of a new version: a lagging secondary could still
+    # return the pre-write result, which would then be cached under the new version.
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+def analytics_alias():
+    return mongoengine.DEFAULT_CONNECTION_NAME if _primary_reads.get() else ANALYTICS_ALIAS
+
 
+def analytics_collection(model):
+    # the model's collection read through the analytics alias (see primary_reads)
+    return get_db(analytics_alias())[model._get_collection_name()]
@@ -18,9 +18,35 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
 # Redis cache settings
-CACHE_ENABLED = os.getenv("CACHE_ENABLED", "False").lower() == "True"
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "False").lower() == "true"
+CACHE_TTL = int(os.getenv("CACHE_TTL", 6 * 60 * 60))
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", 60 * 60))
+CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", 5))
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", 16 * 1024))
 REDIS_URL = os.getenv("REDIS_URL", None)
 ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL", "http://localhost:9200")
+ES_ENABLED = os.getenv("ES_ENABLED", "false").lower() == "true"
+# Pending ES updates, written by the models' signals and drained by `manage.py es_index_worker`
+ES_QUEUE_PATH = os.getenv("ES_QUEUE_PATH", str(BASE_DIR / "es_queue.sqlite3"))
+ES_QUEUE_BATCH_SIZE = int(os.getenv("ES_QUEUE_BATCH_SIZE", 500))
+ES_QUEUE_POLL_INTERVAL = float(os.getenv("ES_QUEUE_POLL_INTERVAL", 0.5))
+ES_BULK_THREADS = int(os.getenv("ES_BULK_THREADS", 4))
+ES_BULK_CHUNK_SIZE = int(os.getenv("ES_BULK_CHUNK_SIZE", 500))
+# documents rejected with 429 are retried up to ES_BULK_MAX_RETRIES times, backing off exponentially
+ES_BULK_MAX_RETRIES = int(os.getenv("ES_BULK_MAX_RETRIES", 5))
+ES_BULK_INITIAL_BACKOFF = float(os.getenv("ES_BULK_INITIAL_BACKOFF", 2))
+ES_BULK_MAX_BACKOFF = float(os.getenv("ES_BULK_MAX_BACKOFF", 60))
+# replicas restored on a versioned index once `manage.py reindex_es` finished loading it
+ES_NUMBER_OF_REPLICAS = int(os.getenv("ES_NUMBER_OF_REPLICAS", 0))
+
+# Route the hot read views to their async (Motor / AsyncElasticsearch) versions; for ASGI servers
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "false").lower() == "true"
+
+# Coalesce /api/sales/new/ increments in memory and flush them in bulk
+SALES_BUFFER_ENABLED = os.getenv("SALES_BUFFER_ENABLED", "false").lower() == "true"
+SALES_BUFFER_MAX_ITEMS = int(os.getenv("SALES_BUFFER_MAX_ITEMS", 1000))
+SALES_BUFFER_INTERVAL = float(os.getenv("SALES_BUFFER_INTERVAL", 1.0))
 
 if CACHE_ENABLED and REDIS_URL:
     CACHES = {